@@ -0,0 +1,237 @@
+# Name: Video Poker Simulation Benchmarks
+# Description:
+#  -Measures evaluator, dealer, strategy and full-session throughput of
+#    video_poker_sim.py and stores the rates as JSON.
+#  -Compares a run against a saved baseline and flags regressions, so
+#    results from two commits can be diffed before a nightly sweep.
+#
+# usage: python benchmark.py [-o OUTPUT] [-c BASELINE] [-t THRESHOLD] [--quick]
+
+# RESOURCES
+import os
+import sys
+import argparse
+import json
+import platform
+import subprocess
+import time
+
+import video_poker_sim as vps
+
+# CONSTANTS
+# Units of work per timed repeat; --quick cuts them by QUICK_FACTOR
+EVALUATE_HANDS = 200000
+BATCH_HANDS = 1000000
+DEALS = 20000
+DECISIONS = {"r": 20000, "k": 20000, "d": 20000, "s1": 20000, "ev": 500, "st": 20000}
+SESSIONS = 3
+QUICK_FACTOR = 10
+
+SESSION_GAMES = ["job", "dw"]
+SESSION_MULTIS = [None, "supt", "ultx"]
+SESSION_HANDS = [1, 10]
+
+# Interactive input cannot be timed
+SKIP_ALGORITHMS = ("i",)
+
+
+def sim_args(*argv):
+    """Parsed video_poker_sim arguments with a stack no session runs out of."""
+    return vps.build_parser().parse_args(["-s", "1e12", "--seed", "1"] + list(argv))
+
+
+def workload(units, args):
+    """Units of work per timed repeat, cut by QUICK_FACTOR for --quick."""
+    return max(1, units // QUICK_FACTOR) if args.quick else units
+
+
+def best_rate(func, repeat):
+    """Best units/second of func() over repeat calls; func returns its units."""
+    best = 0.0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        units = func()
+        elapsed = time.perf_counter() - start
+        best = max(best, units / elapsed)
+    return best
+
+
+def dealt_hands(size, num, seed=1):
+    """num random sorted 5-card hands from a deck of size cards."""
+    rng = vps.np.random.default_rng(seed)
+    return vps.np.sort(rng.random((num, size)).argsort(axis=1)[:, :5], axis=1).astype(vps.np.int8)
+
+
+def bench_evaluate(results, args):
+    # Scalar lookups through VideoPokerSimulation.evaluate() and the
+    # vectorized classify_batch() of the batch engine, per game
+    for game, (hand_types, _) in vps.GAME_TYPES.items():
+        p4 = vps.VideoPokerSimulation(sim_args("-g", game, "-n", "1"))
+        hands = dealt_hands(vps.deck_size(hand_types), workload(EVALUATE_HANDS, args)).tolist()
+
+        def evaluate():
+            cards = p4.group[0].cards
+            for hand in hands:
+                cards[:] = hand
+                p4.evaluate(0)
+            return len(hands)
+
+        results["evaluate[%s]" % game] = {"rate": best_rate(evaluate, args.repeat), "unit": "hands/s"}
+
+        batch = dealt_hands(vps.deck_size(hand_types), workload(BATCH_HANDS, args))
+        vps.classify_batch(batch[:1], hand_types)
+
+        def classify():
+            vps.classify_batch(batch, hand_types)
+            return len(batch)
+
+        results["classify_batch[%s]" % game] = {"rate": best_rate(classify, args.repeat), "unit": "hands/s"}
+
+
+def bench_deal_draw(results, args):
+    # deal() + draw() of a discard-all hold, so every hand draws 5 cards
+    deals = workload(DEALS, args)
+    for hands in SESSION_HANDS:
+        p4 = vps.VideoPokerSimulation(sim_args("-a", "d", "-n", str(hands)))
+
+        def deal_draw():
+            for _ in range(deals):
+                p4.deal()
+                p4.draw()
+            return deals
+
+        results["deal_draw[n=%d]" % hands] = {"rate": best_rate(deal_draw, args.repeat), "unit": "deals/s"}
+
+
+def bench_decisions(results, args):
+    # Each algorithm's hold decision on the same dealt hands
+    p4 = vps.VideoPokerSimulation(sim_args("-n", "1", "--strategy_dir", args.strategy_dir))
+    for alg, algorithm in p4.algorithms.items():
+        if alg in SKIP_ALGORITHMS:
+            continue
+        name = "decision[%s]" % alg
+        if alg == "st" and not os.path.exists(vps.strategy_table_path(args.strategy_dir, p4.game)):
+            print("Skipping", name, "- build the table with video_poker_sim.py --build_strategy")
+            continue
+        hands = dealt_hands(len(vps.DECK), workload(DECISIONS[alg], args)).tolist()
+        p4.group[0].cards = hands[0]
+        p4.group[0].update()
+        algorithm()
+
+        def decide():
+            hand = p4.group[0]
+            for cards in hands:
+                hand.cards = cards
+                hand.update()
+                algorithm()
+            return len(hands)
+
+        results[name] = {"rate": best_rate(decide, args.repeat), "unit": "decisions/s"}
+
+
+def bench_sessions(results, args):
+    # Full 720-round play() sessions across -g/-m/-n
+    sessions = workload(SESSIONS, args)
+    for game in SESSION_GAMES:
+        for multi in SESSION_MULTIS:
+            for hands in SESSION_HANDS:
+                argv = ["-g", game, "-n", str(hands), "-e", "t"]
+                if multi is not None:
+                    argv += ["-m", multi]
+                session_args = sim_args(*argv)
+                vps.VideoPokerSimulation(session_args)
+
+                def play():
+                    for seed in range(sessions):
+                        vps.VideoPokerSimulation(session_args, seed).play()
+                    return sessions
+
+                name = "session[g=%s,m=%s,n=%d]" % (game, multi, hands)
+                results[name] = {"rate": best_rate(play, args.repeat), "unit": "sessions/s"}
+
+
+def metadata():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": vps.np.__version__,
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def compare(results, baseline, threshold):
+    """Print rate changes against baseline and return the regressed names."""
+    regressions = []
+    print("\n%-36s %14s %14s %8s" % ("benchmark", "baseline", "current", "change"))
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        old = baseline[name]["rate"]
+        new = result["rate"]
+        change = new / old - 1
+        flag = ""
+        if change < -threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print("%-36s %14.1f %14.1f %+7.1f%%%s" % (name, old, new, 100 * change, flag))
+    return regressions
+
+
+def main(args):
+    results = {}
+    for bench in args.only or list(BENCHMARKS):
+        start = time.perf_counter()
+        BENCHMARKS[bench](results, args)
+        print("Benchmark %s: %.1fs" % (bench, time.perf_counter() - start))
+
+    for name, result in results.items():
+        print("%-36s %14.1f %s" % (name, result["rate"], result["unit"]))
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({"meta": metadata(), "results": results}, file, indent=2)
+        print("Results written to", args.output)
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline["results"], args.threshold)
+        if regressions:
+            print("\n%d regression(s) beyond %.0f%% vs %s" % (len(regressions), 100 * args.threshold, args.compare))
+            sys.exit(1)
+
+
+BENCHMARKS = {
+    "evaluate": bench_evaluate,
+    "deal_draw": bench_deal_draw,
+    "decisions": bench_decisions,
+    "sessions": bench_sessions,
+}
+
+# COMMAND-LINE EXECUTION
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="Video Poker Simulation Benchmarks",
+        description="Throughput of the evaluator, dealer, strategies and full sessions.",
+    )
+    parser.add_argument("-o", "--output", default=None, help="Write the results as JSON to this file")
+    parser.add_argument("-c", "--compare", default=None, help="Baseline JSON results to compare against")
+    parser.add_argument("-t", "--threshold", default=0.1, type=float,
+        help="Fractional slowdown vs --compare reported as a regression (exit status 1)")
+    parser.add_argument("--repeat", default=3, type=int, help="Timed repeats per benchmark; the best rate is kept")
+    parser.add_argument("--quick", action="store_true", help="Run a tenth of the work per benchmark")
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS),
+        help="Run only these benchmark groups")
+    parser.add_argument("--strategy_dir", default=".", help="Directory of strategy_<game>.npy tables for -a st")
+    main(parser.parse_args())
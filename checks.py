@@ -0,0 +1,172 @@
+# Name: Video Poker Simulation Checks
+# Description:
+#  -Exhaustive and brute-force checks of the fast paths of video_poker_sim.py
+#    against their slow definitions: the prime-product lookup classifier
+#    against the is_* predicate chain, hold_count()/hold_counts() against
+#    redrawing every card, the exact -a ev returns against published ones, and
+#    the exact -a s1 return against playing every dealt hand one by one.
+#  -Prints one line per check and exits with status 1 if any fails.
+#
+# usage: python checks.py [--only {classifier,hold_count,exact,exact_s1} [...]] [-w WORKERS]
+
+# RESOURCES
+import sys
+import argparse
+import itertools
+import math
+import time
+
+import video_poker_sim as vps
+
+# CONSTANTS
+CLASSIFIER_GAMES = ["job", "db", "tdb"]
+
+# Sorted dealt hands per game whose every hold is redrawn exhaustively
+HOLD_COUNT_GAMES = ["job", "dw", "jp"]
+HOLD_COUNT_HANDS = 3
+
+# Published returns of optimal play (-x -a ev) and the tolerance of the check
+EXACT_RETURNS = {"job": 0.98450, "dw": 1.00762, "jp": 1.00646}
+EXACT_TOLERANCE = 5e-6
+
+# Games whose exact -a s1 return is checked against every dealt hand
+EXACT_S1_GAMES = ["job"]
+EXACT_S1_TOLERANCE = 1e-9
+EXACT_S1_BATCH = 65536
+
+
+def combinations(n, k):
+    """All C(n, k) sorted k-subsets of range(n) as an int array."""
+    count = math.comb(n, k)
+    flat = vps.np.fromiter(itertools.chain.from_iterable(itertools.combinations(range(n), k)), dtype=vps.np.int64,
+        count=k * count)
+    return flat.reshape(count, k)
+
+
+def check_classifier(args):
+    # classify_batch() of every 5-card hand against the first matching
+    # predicate of the game, evaluated on a Hand like the original engine
+    hands = vps.all_hands()
+    failures = []
+    for game in CLASSIFIER_GAMES:
+        hand_types = vps.GAME_TYPES[game][0]
+        names = vps.hand_type_names(hand_types)
+        types = vps.classify_batch(hands, hand_types).tolist()
+        hand = vps.Hand()
+        mismatches = 0
+        for cards, type_index in zip(hands.tolist(), types):
+            hand.cards[:] = cards
+            hand.update()
+            if vps.classify(hand, hand_types) != names[type_index]:
+                mismatches += 1
+        report("classifier[%s]" % game, mismatches == 0, "%d / %d hands differ" % (mismatches, len(hands)))
+        if mismatches:
+            failures.append(game)
+    return failures
+
+
+def check_hold_count(args):
+    # Inclusion-exclusion counts of every hold against classifying every
+    # possible redraw of the unseen cards
+    rng = vps.np.random.default_rng(1)
+    failures = []
+    for game in HOLD_COUNT_GAMES:
+        hand_types = vps.GAME_TYPES[game][0]
+        size = vps.deck_size(hand_types)
+        draws = {num: combinations(size - 5, num) for num in range(6)}
+        mismatches = 0
+        for cards in vps.np.sort(rng.permutation(size)[:5 * HOLD_COUNT_HANDS].reshape(-1, 5), axis=1).tolist():
+            unseen = vps.np.array([card for card in range(size) if card not in cards])
+            counts = vps.hold_counts(cards, hand_types)
+            for mask in vps.HOLD_MASKS:
+                held = vps.np.array([card for i, card in enumerate(cards) if mask >> i & 1], dtype=vps.np.int64)
+                redraws = unseen[draws[5 - len(held)]]
+                finals = vps.np.concatenate((vps.np.broadcast_to(held, (len(redraws), len(held))), redraws), axis=1)
+                brute = vps.np.bincount(vps.classify_batch(finals, hand_types), minlength=counts.shape[1])
+                if not (vps.np.array_equal(brute, counts[mask]) and vps.np.array_equal(brute,
+                        vps.hold_count(cards, mask, hand_types))):
+                    mismatches += 1
+        holds = HOLD_COUNT_HANDS * len(vps.HOLD_MASKS)
+        report("hold_count[%s]" % game, mismatches == 0, "%d / %d holds differ" % (mismatches, holds))
+        if mismatches:
+            failures.append(game)
+    return failures
+
+
+def check_exact(args):
+    # Optimal play over every dealt hand against the published returns
+    failures = []
+    for game, published in EXACT_RETURNS.items():
+        sim_args = vps.build_parser().parse_args(["-g", game, "-a", "ev", "-w", str(args.workers)])
+        _, probs = vps.exact_type_probs(sim_args)
+        exact_return = float(probs @ vps.np.array(vps.GAME_TYPES[game][1]))
+        passed = abs(exact_return - published) <= EXACT_TOLERANCE
+        report("exact_return[%s]" % game, passed, "%.6f vs published %.5f" % (exact_return, published))
+        if not passed:
+            failures.append(game)
+    return failures
+
+
+def check_exact_s1(args):
+    # -a s1 is not suit-symmetric, so the exact pass must not rely on
+    # canonical classes: compare it with the scalar hold of every dealt hand
+    failures = []
+    for game in EXACT_S1_GAMES:
+        sim_args = vps.build_parser().parse_args(["-g", game, "-a", "s1", "-w", str(args.workers)])
+        hand_types, pays = vps.GAME_TYPES[game]
+        _, probs = vps.exact_type_probs(sim_args)
+        exact_return = float(probs @ vps.np.array(pays))
+
+        p4 = vps.VideoPokerSimulation(sim_args)
+        hands = vps.all_hands(vps.deck_size(hand_types))
+        draws = vps.np.array([math.comb(vps.deck_size(hand_types) - 5, 5 - size) for size in vps.HOLD_SIZES])
+        total = 0.0
+        for start in range(0, len(hands), EXACT_S1_BATCH):
+            dealt = hands[start : start + EXACT_S1_BATCH]
+            held = vps.np.zeros(dealt.shape, dtype=bool)
+            for row, cards in enumerate(dealt.tolist()):
+                p4.group[0].cards = cards
+                p4.group[0].update()
+                held[row] = p4.keep_mask(p4.algorithm())
+            masks = (held << vps.np.arange(5)).sum(axis=1)
+            total += float((vps.hold_count_batch(dealt, held, hand_types) @ vps.np.array(pays) / draws[masks]).sum())
+        brute_return = total / len(hands)
+        passed = abs(exact_return - brute_return) <= EXACT_S1_TOLERANCE
+        report("exact_s1[%s]" % game, passed, "%.9f vs every hand %.9f" % (exact_return, brute_return))
+        if not passed:
+            failures.append(game)
+    return failures
+
+
+def report(name, passed, detail):
+    print("%-24s %s  %s" % (name, "ok" if passed else "FAIL", detail), flush=True)
+
+
+def main(args):
+    failed = []
+    for check in args.only or list(CHECKS):
+        start = time.perf_counter()
+        if CHECKS[check](args):
+            failed.append(check)
+        print("Check %s: %.1fs" % (check, time.perf_counter() - start))
+    if failed:
+        print("\nFailed checks:", ", ".join(failed))
+        sys.exit(1)
+
+
+CHECKS = {
+    "classifier": check_classifier,
+    "hold_count": check_hold_count,
+    "exact": check_exact,
+    "exact_s1": check_exact_s1,
+}
+
+# COMMAND-LINE EXECUTION
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="Video Poker Simulation Checks",
+        description="Exhaustive checks of the classifier, hold counts and exact returns.",
+    )
+    parser.add_argument("--only", nargs="+", choices=list(CHECKS), help="Run only these checks")
+    parser.add_argument("-w", "--workers", default=1, type=int, help="Worker processes for the exact returns")
+    main(parser.parse_args())
@@ -10,14 +10,47 @@
 #  -Stats and Plots can be generated for analysis.
 
 # RESOURCES
+import time
+
+START_TIME = time.perf_counter()
+
 import os
 import sys
 import argparse
+import importlib.util
+import json
+from array import array
 import random
-import time
-import copy
-import matplotlib.pyplot as plt
-import numpy as np
+import functools
+import itertools
+import math
+import multiprocessing
+import struct
+import tracemalloc
+
+
+def lazy_import(name):
+    """Module whose import runs on first attribute access.
+
+    Short scalar sessions never touch NumPy, so its import cost is only paid
+    by the paths that use it. matplotlib is imported inside gen_plot().
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def is_loaded(name):
+    """True once a module has actually been imported (not just lazily bound)."""
+    return type(sys.modules.get(name)) is type(sys)
+
+
+np = lazy_import("numpy")
 
 # CONSTANTS
 CARDS = {
@@ -73,77 +106,93 @@ CARDS = {
     "12QC": {"val": 12, "cat": 1},
     "13KC": {"val": 13, "cat": 1},
     "14AC": {"val": 14, "cat": 1},
+    "15JK": {"val": 15, "cat": 0},
 }
 
 CARDS_KEYS = list(CARDS.keys())
 
-CATEGORY = {"s": 4, "h": 3, "d": 2, "c": 1}
-
-CATEGORY_KEYS = list(CATEGORY.keys())
-
-RETURNS_JoB = {
-    "RF": 800,
-    "SF": 50,
-    "4K": 25,
-    "FH": 9,
-    "F": 5,
-    "S": 4,
-    "3K": 3,
-    "2P": 2,
-    "JoB": 1,
+# Cards are encoded as ints 0..52: card = 4 * (val - 2) + (cat - 1).
+# Sorting encoded cards orders them exactly like the zero-padded CARDS names,
+# so names are only needed for display. The joker of wild games is card 52.
+CARD_NAMES = sorted(CARDS_KEYS)
+JOKER = CARD_NAMES.index("15JK")
+DECK = list(range(JOKER))
+CARD_VALS = [CARDS[name]["val"] for name in CARD_NAMES]
+CARD_CATS = [CARDS[name]["cat"] for name in CARD_NAMES]
+
+# A distinct prime per value: the product of a hand's primes identifies its
+# value multiset, and ANDing the suit bits is non-zero only for a flush.
+VAL_PRIMES = {2: 2, 3: 3, 4: 5, 5: 7, 6: 11, 7: 13, 8: 17, 9: 19, 10: 23, 11: 29, 12: 31, 13: 37, 14: 41}
+CARD_PRIMES = [VAL_PRIMES[CARD_VALS[card]] for card in DECK]
+CARD_SUIT_BITS = [1 << (CARD_CATS[card] - 1) for card in DECK]
+
+# Wild modes of a paytable: deck size and the cards that play as any card.
+# Wild cards key with their own prime and match every suit.
+WILD_MODES = {
+    None: (len(DECK), ()),
+    "deuces": (len(DECK), (0, 1, 2, 3)),
+    "joker": (len(DECK) + 1, (JOKER,)),
 }
+WILD_PRIME = 43
+WILD_SUIT_BITS = 0xF
 
-RETURNS_KEYS = list(RETURNS_JoB.keys())
-
-RETURNS_DBJoB = {
-    "RF": 800,
-    "4KA": 160,
-    "4K2_4": 80,
-    "4K": 50,
-    "SF": 50,
-    "FH": 9,
-    "F": 5,
-    "S": 4,
-    "3K": 3,
-    "2P": 1,
-    "JoB": 1,
-}
-
-RETURNS_KEYS2 = list(RETURNS_DBJoB.keys())
-
-RETURNS_TDBJoB = {
-    "RF": 800,
-    "4KA_2_4": 800,
-    "4K2_4_A_4": 400,
-    "4KA": 160,
-    "4K2_4": 80,
-    "4K": 50,
-    "SF": 50,
-    "FH": 9,
-    "F": 5,
-    "S": 4,
-    "3K": 2,
-    "2P": 1,
-    "JoB": 1,
-}
+CATEGORY = {"s": 4, "h": 3, "d": 2, "c": 1}
 
-RETURNS_KEYS3 = list(RETURNS_TDBJoB.keys())
+CATEGORY_KEYS = list(CATEGORY.keys())
 
+# Simulation methods timed by --profile, and allocation sites reported
+PROFILE_PHASES = ("update_multiplier", "deal", "draw", "algorithm", "sample_round", "evaluate", "analyze", "hold_masks")
+PROFILE_TOP_ALLOCATIONS = 5
+
+# --event_log records: one fixed-width little-endian row per hand, readable
+# with read_event_log() as a memory-mapped NumPy structured array. Cards are
+# encoded ints and hold bits refer to dealt positions.
+EVENT_FIELDS = [
+    ("step", "<u4"),
+    ("hand", "<u2"),
+    ("dealt", "u1", (5,)),
+    ("hold", "u1"),
+    ("final", "u1", (5,)),
+    ("type", "u1"),
+    ("multiplier", "<u2"),
+    ("payout", "<f8"),
+    ("balance", "<f8"),
+]
+EVENT_STRUCT = struct.Struct("<IH5BB5BBHdd")
+EVENT_MAGIC = b"VPEVLOG1"
+EVENT_HEADER_ALIGN = 64
+EVENT_BUFFER_BYTES = 1 << 20
+
+# Paytable config read at import; --paytables replaces it
+PAYTABLES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "paytables.json")
+
+# Multiplier a winning hand earns for the same hand of the next round; a
+# game's "ultimate_x" in the paytable config overrides these per category
 ULTIMATE_X_MULTIPLIER = {
+    "NRF": 2,
+    "4W": 2,
+    "WRF": 2,
+    "5K": 2,
     "RF": 2,
+    "4KA_2_4": 2,
+    "4K2_4_A_4": 2,
     "4K": 2,
     "4KA": 2,
     "4K2_4": 2,
     "4K5_K": 2,
-    "SF": 50,
+    "SF": 2,
     "FH": 12,
     "F": 10,
     "S": 8,
     "3K": 4,
     "2P": 3,
     "JoB": 2,
+    "KoB": 2,
 }
 
+# Approximate value in bets of one multiplier unit carried to the next hand
+ULTIMATE_X_UNIT_VALUE = 1.0
+
 
 NUM_CARDS = range(1, 6)
 
@@ -180,26 +229,33 @@ QUIT = ("q", "quit")
 ALL = ("a", "all")
 NONE = ("n", "none")
 
-ULTIMATE_X_MULTIPLIER = {
-    "RF": 2,
-    "4K": 2,
-    "4KA": 2,
-    "4K2_4": 2,
-    "4K5_K": 2,
-    "SF": 50,
-    "FH": 12,
-    "F": 10,
-    "S": 8,
-    "3K": 4,
-    "2P": 3,
-    "JoB": 2,
-}
-
-SUPER_T_TIMER = list(range(15))
-SUPER_T_MULTIPLER = list([2, 2, 2, 2, 2, 3, 4, 5, 8, 10])
+# Super Times Pay: chance a round triggers, the equally likely multipliers
+# it then draws from, and the surcharge per bet
+SUPER_T_PROB = 1 / 15
+SUPER_T_MULTIPLER = [2, 2, 2, 2, 2, 3, 4, 5, 8, 10]
+SUPER_T_COST = 0.2
 
 MULTIPLER_OPTIONS = ("supt", "ultx")
 
+# Rounds dealt per array pass in batch mode
+BATCH_ROUNDS = 1000
+
+# Strategies whose hold follows its cards under any suit relabelling, so
+# the exact analyses may solve one canonical hand per class; the others
+# (s1 reads suits and values sorted separately) enumerate every hand
+SUIT_SYMMETRIC_ALGORITHMS = ("ev", "st", "r", "k", "d")
+EXACT_BATCH_HANDS = 65536
+
+# Hands per round from which round payout distributions use one FFT power
+FFT_MIN_HANDS = 3
+
+# Payout of one hand in bets that counts as a big hit (-e r)
+BIG_PAY = 25
+
+# Uniform draws generated per refill by the NumPy random backends
+RNG_BLOCK = 4096
+RNG_BACKENDS = ("random", "pcg64", "philox")
+
 # SAMPLE INPUTS
 GROUP_RF = ["10Ts", "11Js", "12Qs", "13Ks", "14As"]
 GROUP_SF = ["022s", "033s", "044s", "055s", "066s"]
@@ -214,194 +270,1041 @@ GROUP_JoB = ["11Js", "11Jh", "055s", "077h", "088d"]
 
 
 # FUNCTIONS
-def is_rf(group):
+def card_names(cards, short=True):
+    """Display names for encoded cards, e.g. "AS" (short) or "14AS"."""
+    if short:
+        return [CARD_NAMES[x][2:] for x in cards]
+    return [CARD_NAMES[x] for x in cards]
+
+
+def is_rf(hand):
     condition = False
-    if (
-        group["d_cats"] == FLUSH
-        and group["d_vals"] == STRAIGHT
-        and group["vals"][4] == 14
-    ):
+    if hand.flush and hand.d_vals == STRAIGHT and hand.vals[4] == 14:
         condition = True
     return condition
 
 
-def is_sf(group):
+def is_sf(hand):
     condition = False
-    if group["d_cats"] == FLUSH and group["d_vals"] in (STRAIGHT, AL_STRAIGHT):
+    if hand.flush and hand.d_vals in (STRAIGHT, AL_STRAIGHT):
         condition = True
     return condition
 
 
-def is_4k(group):
+def is_4k(hand):
     condition = False
-    if group["d_vals"].count(0) == 3 and (
-        (
-            group["d_vals"][0] == 0
-            and group["d_vals"][1] == 0
-            and group["d_vals"][2] == 0
-        )
-        or (
-            group["d_vals"][1] == 0
-            and group["d_vals"][2] == 0
-            and group["d_vals"][3] == 0
-        )
-    ):
+    if 4 in hand.counts:
         condition = True
     return condition
 
 
-def is_4ka(group):
+def is_4ka(hand):
     condition = False
-    if (
-        group["d_vals"].count(0) == 3
-        and (
-            (
-                group["d_vals"][0] == 0
-                and group["d_vals"][1] == 0
-                and group["d_vals"][2] == 0
-            )
-            or (
-                group["d_vals"][1] == 0
-                and group["d_vals"][2] == 0
-                and group["d_vals"][3] == 0
-            )
-        )
-        and group["vals"][2] == 14
-    ):
+    if hand.counts[14] == 4:
         condition = True
     return condition
 
 
-def is_4k2_4(group):
+def is_4k2_4(hand):
     condition = False
-    if (
-        group["d_vals"].count(0) == 3
-        and (
-            (
-                group["d_vals"][0] == 0
-                and group["d_vals"][1] == 0
-                and group["d_vals"][2] == 0
-            )
-            or (
-                group["d_vals"][1] == 0
-                and group["d_vals"][2] == 0
-                and group["d_vals"][3] == 0
-            )
-        )
-        and group["vals"][2] in (2, 3, 4)
-    ):
+    if 4 in hand.counts[2:5]:
         condition = True
     return condition
 
 
-def is_4ka_2_4(group):
+def is_4ka_2_4(hand):
     condition = False
-    if (
-        group["d_vals"].count(0) == 3
-        and (
-            (
-                group["d_vals"][0] == 0
-                and group["d_vals"][1] == 0
-                and group["d_vals"][2] == 0
-            )
-            or (
-                group["d_vals"][1] == 0
-                and group["d_vals"][2] == 0
-                and group["d_vals"][3] == 0
-            )
-        )
-        and group["vals"][2] == 14
-        and group["vals"][0] <= 4
-    ):
+    if hand.counts[14] == 4 and hand.vals[0] <= 4:
         condition = True
     return condition
 
 
-def is_4k2_4_a_4(group):
+def is_4k2_4_a_4(hand):
     condition = False
-    if (
-        group["d_vals"].count(0) == 3
-        and (
-            (
-                group["d_vals"][0] == 0
-                and group["d_vals"][1] == 0
-                and group["d_vals"][2] == 0
-            )
-            or (
-                group["d_vals"][1] == 0
-                and group["d_vals"][2] == 0
-                and group["d_vals"][3] == 0
-            )
-        )
-        and group["vals"][2] in (2, 3, 4)
-        and (group["vals"][4] == 14 or group["vals"][4] <= 4)
+    if 4 in hand.counts[2:5] and (
+        hand.counts[14] == 1 or sum(hand.counts[2:5]) == 5
     ):
         condition = True
     return condition
 
 
-def is_fh(group):
+def is_fh(hand):
     condition = False
-    if group["d_vals"].count(0) == 3 and (
-        (
-            group["d_vals"][0] == 0
-            and group["d_vals"][1] == 0
-            and group["d_vals"][3] == 0
-        )
-        or (
-            group["d_vals"][0] == 0
-            and group["d_vals"][2] == 0
-            and group["d_vals"][3] == 0
-        )
-    ):
+    if 3 in hand.counts and 2 in hand.counts:
         condition = True
     return condition
 
 
-def is_f(group):
+def is_f(hand):
     condition = False
-    if group["d_cats"] == FLUSH:
+    if hand.flush:
         condition = True
     return condition
 
 
-def is_s(group):
+def is_s(hand):
     condition = False
-    if group["d_vals"] in (STRAIGHT, AL_STRAIGHT):
+    if hand.d_vals in (STRAIGHT, AL_STRAIGHT):
         condition = True
     return condition
 
 
-def is_3k(group):
+def is_3k(hand):
     condition = False
-    if group["d_vals"].count(0) == 2 and (
-        (group["d_vals"][0] == 0 and group["d_vals"][1] == 0)
-        or (group["d_vals"][1] == 0 and group["d_vals"][2] == 0)
-        or (group["d_vals"][2] == 0 and group["d_vals"][3] == 0)
-    ):
+    if 3 in hand.counts and 2 not in hand.counts:
         condition = True
     return condition
 
 
-def is_2p(group):
+def is_2p(hand):
     condition = False
-    if group["d_vals"].count(0) == 2:
+    if hand.counts.count(2) == 2:
         condition = True
     return condition
 
 
-def is_job(group):
+def is_job(hand):
     condition = False
-    if group["d_vals"].count(0) == 1:
-        index = group["d_vals"].index(0)
-        if group["vals"][index] > 10:
+    if hand.counts.count(2) == 1 and hand.counts.count(1) == 3:
+        if 2 in hand.counts[11:]:
             condition = True
     return condition
 
 
+def is_nrf(hand):
+    condition = False
+    if hand.wilds == 0 and is_rf(hand):
+        condition = True
+    return condition
+
+
+def is_4w(hand):
+    condition = False
+    if hand.wilds == 4:
+        condition = True
+    return condition
+
+
+def is_5k(hand):
+    condition = False
+    if 5 in hand.counts:
+        condition = True
+    return condition
+
+
+def is_kob(hand):
+    condition = False
+    if hand.counts.count(2) == 1 and hand.counts.count(1) == 3:
+        if 2 in hand.counts[13:]:
+            condition = True
+    return condition
+
+
+class Hand(object):
+    """One hand of a round, reused in place from round to round.
+
+    cards holds the encoded cards; update() derives the sorted values, sorted
+    categories, their diffs, the value-count histogram and the flush flag
+    that the is_* predicates and the strategies read. wilds counts the wild
+    cards a value assignment stands in for when wild tables are built.
+    """
+
+    __slots__ = (
+        "cards",
+        "vals",
+        "cats",
+        "d_vals",
+        "d_cats",
+        "counts",
+        "flush",
+        "wilds",
+        "type",
+        "ret",
+        "multi",
+    )
+
+    def __init__(self):
+        self.cards = [0] * 5
+        self.vals = [0] * 5
+        self.cats = [0] * 5
+        self.d_vals = [0] * 4
+        self.d_cats = [0] * 4
+        self.counts = [0] * 16
+        self.flush = False
+        self.wilds = 0
+        self.type = None
+        self.ret = 0
+        self.multi = 1
+
+    def update(self):
+        cards = self.cards
+        cards.sort()
+        vals = self.vals
+        cats = self.cats
+        vals[:] = [CARD_VALS[x] for x in cards]
+        cats[:] = [CARD_CATS[x] for x in cards]
+        cats.sort()
+        self.d_vals[:] = [vals[i] - vals[i - 1] for i in range(1, 5)]
+        self.d_cats[:] = [cats[i] - cats[i - 1] for i in range(1, 5)]
+        counts = self.counts
+        counts[:] = [0] * 16
+        for val in vals:
+            counts[val] += 1
+        self.flush = cats[0] == cats[4]
+
+    def assign(self, vals, flush, wilds):
+        """Set the derived fields from sorted values alone (no cards)."""
+        self.vals[:] = vals
+        self.d_vals[:] = [vals[i] - vals[i - 1] for i in range(1, 5)]
+        self.counts[:] = [0] * 16
+        for val in vals:
+            self.counts[val] += 1
+        self.flush = flush
+        self.wilds = wilds
+
+    def snapshot(self):
+        """Plain dict copy of the hand for reporting."""
+        return {
+            "cards": self.cards[:],
+            "vals": self.vals[:],
+            "cats": self.cats[:],
+            "d_vals": self.d_vals[:],
+            "d_cats": self.d_cats[:],
+            "type": self.type,
+            "ret": self.ret,
+            "multi": self.multi,
+        }
+
+
+# Hand categories a paytable can list, by name
+HAND_PREDICATES = {
+    "RF": is_rf,
+    "SF": is_sf,
+    "4KA_2_4": is_4ka_2_4,
+    "4K2_4_A_4": is_4k2_4_a_4,
+    "4KA": is_4ka,
+    "4K2_4": is_4k2_4,
+    "4K": is_4k,
+    "FH": is_fh,
+    "F": is_f,
+    "S": is_s,
+    "3K": is_3k,
+    "2P": is_2p,
+    "JoB": is_job,
+    "NRF": is_nrf,
+    "4W": is_4w,
+    "WRF": is_rf,
+    "5K": is_5k,
+    "KoB": is_kob,
+}
+
+
+class HandTypes(tuple):
+    """(name, predicate) hand types in priority order for one wild mode.
+
+    Equality and hashing include the wild mode, so every table cached per
+    hand types is also per deck.
+    """
+
+    def __new__(cls, hand_types, wild=None):
+        self = super().__new__(cls, hand_types)
+        self.wild = wild
+        return self
+
+    def __getnewargs__(self):
+        return tuple(self), self.wild
+
+    def __eq__(self, other):
+        return tuple.__eq__(self, other) and self.wild == getattr(other, "wild", None)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((tuple(self), self.wild))
+
+
+def deck_size(hand_types):
+    """Number of cards in the deck of a game's hand types."""
+    return WILD_MODES[getattr(hand_types, "wild", None)][0]
+
+
+@functools.lru_cache(maxsize=None)
+def card_keys(wild):
+    """Prime and suit bit lists by card for the deck of a wild mode."""
+    size, wilds = WILD_MODES[wild]
+    primes = [WILD_PRIME if card in wilds else CARD_PRIMES[card] for card in range(size)]
+    suit_bits = [WILD_SUIT_BITS if card in wilds else CARD_SUIT_BITS[card] for card in range(size)]
+    return primes, suit_bits
+
+
+def classify(hand, hand_types):
+    """First hand type in priority order whose predicate matches, else None."""
+    for hand_type, predicate in hand_types:
+        if predicate(hand):
+            return hand_type
+    return None
+
+
+@functools.lru_cache(maxsize=None)
+def hand_table(hand_types):
+    """Hand type lookup tables keyed by the prime product of the card values.
+
+    Every five card hand reduces to its value multiset plus a flush flag, so
+    the 7462 keys built here classify all 2,598,960 hands. Returns the
+    (non-flush, flush) dicts.
+    """
+    if getattr(hand_types, "wild", None) is not None:
+        return wild_hand_table(hand_types)
+    ranks = {}
+    flushes = {}
+    hand = Hand()
+    for vals in itertools.combinations_with_replacement(range(2, 15), 5):
+        if vals[0] == vals[4]:
+            continue
+        key = 1
+        for val in vals:
+            key *= VAL_PRIMES[val]
+        # A representative hand: repeated values take successive suits
+        hand.cards[:] = [4 * (val - 2) + vals[:i].count(val) for i, val in enumerate(vals)]
+        if len(set(vals)) == 5:
+            hand.update()
+            flushes[key] = classify(hand, hand_types)
+            hand.cards[4] += 1
+        hand.update()
+        ranks[key] = classify(hand, hand_types)
+    return ranks, flushes
+
+
+def wild_hand_table(hand_types):
+    """hand_table() for a game with wild cards.
+
+    Keys are the product of the natural cards' primes and WILD_PRIME per
+    wild card; a hand is suited when its naturals share a suit. Each key
+    takes the best type over every value the wilds can stand for, so play
+    stays one lookup while the substitution only runs here.
+    """
+    size, wilds = WILD_MODES[hand_types.wild]
+    naturals = sorted({CARD_VALS[card] for card in range(size) if card not in wilds})
+    priority = {hand_type: i for i, (hand_type, _) in enumerate(hand_types)}
+    ranks = {}
+    flushes = {}
+    hand = Hand()
+    for num_wilds in range(len(wilds) + 1):
+        for vals in itertools.combinations_with_replacement(naturals, 5 - num_wilds):
+            if any(vals.count(val) > 4 for val in vals):
+                continue
+            key = WILD_PRIME ** num_wilds
+            for val in vals:
+                key *= VAL_PRIMES[val]
+            distinct = len(set(vals)) == len(vals)
+            for suited, table in ((False, ranks), (True, flushes)):
+                if suited and not distinct:
+                    continue
+                best = None
+                for subs in itertools.combinations_with_replacement(range(2, 15), num_wilds):
+                    full = sorted(vals + subs)
+                    hand.assign(full, suited and len(set(full)) == 5, num_wilds)
+                    hand_type = classify(hand, hand_types)
+                    if hand_type is not None and (best is None or priority[hand_type] < priority[best]):
+                        best = hand_type
+                table[key] = best
+    return ranks, flushes
+
+
+# Paytable registry: game id -> (hand types in priority order, pays indexed
+# like hand_table_arrays(hand_types)[0]), game id -> display name, and game
+# id -> Ultimate X multipliers indexed like the pays
+GAME_TYPES = {}
+GAME_NAMES = {}
+GAME_ULTIMATE_X = {}
+
+
+def register_paytables(path):
+    """Compile the games of a paytable config file into the registry.
+
+    The file (JSON, or TOML/YAML when tomllib/PyYAML are available) maps
+    each game id to its "name" and "pays", a list of [category, pay] pairs
+    in classification priority order with categories from HAND_PREDICATES,
+    and optionally "wild", a WILD_MODES key, and "ultimate_x", a map of
+    category to the Ultimate X multiplier it earns (ULTIMATE_X_MULTIPLIER
+    otherwise).
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".toml":
+        import tomllib
+
+        with open(path, "rb") as f:
+            config = tomllib.load(f)
+    elif extension in (".yaml", ".yml"):
+        import yaml
+
+        with open(path) as f:
+            config = yaml.safe_load(f)
+    else:
+        with open(path) as f:
+            config = json.load(f)
+
+    for game, table in config.items():
+        unknown = [name for name, _ in table["pays"] if name not in HAND_PREDICATES]
+        if unknown:
+            raise ValueError("%s: game %s has unknown hand categories %s" % (path, game, unknown))
+        if table.get("wild") not in WILD_MODES:
+            raise ValueError("%s: game %s has unknown wild mode %r" % (path, game, table["wild"]))
+        ultimate_x = table.get("ultimate_x", {})
+        names = [name for name, _ in table["pays"]]
+        invalid = [name for name, multiplier in ultimate_x.items() if name not in names or int(multiplier) < 1]
+        if invalid:
+            raise ValueError("%s: game %s has invalid Ultimate X multipliers for %s" % (path, game, invalid))
+        hand_types = HandTypes(((name, HAND_PREDICATES[name]) for name in names), table.get("wild"))
+        pays = (0,) + tuple(int(pay) for _, pay in table["pays"])
+        GAME_TYPES[game] = (hand_types, pays)
+        GAME_NAMES[game] = table.get("name", game)
+        GAME_ULTIMATE_X[game] = (1,) + tuple(
+            int(ultimate_x.get(name, ULTIMATE_X_MULTIPLIER.get(name, 1))) for name in names
+        )
+
+
+register_paytables(PAYTABLES_PATH)
+
+
+@functools.lru_cache(maxsize=None)
+def hand_table_arrays(hand_types):
+    """Sorted-key array form of hand_table() for vectorized lookups.
+
+    Returns (names, (keys, types), (flush_keys, flush_types)) where types
+    index into names and names[0] is None (no paying hand).
+    """
+    names = hand_type_names(hand_types)
+    tables = []
+    for table in hand_table(hand_types):
+        keys = np.array(sorted(table), dtype=np.int64)
+        types = np.array([names.index(table[key]) for key in keys], dtype=np.int8)
+        tables.append((keys, types))
+    return names, tables[0], tables[1]
+
+
+def hand_type_names(hand_types):
+    """Hand type names indexed like every type table, None (no pay) first."""
+    return [None] + [hand_type for hand_type, _ in hand_types]
+
+
+@functools.lru_cache(maxsize=None)
+def hand_index_table(hand_types):
+    """hand_table() with each type replaced by its index in hand_type_names()."""
+    names = hand_type_names(hand_types)
+    return tuple({key: names.index(name) for key, name in table.items()} for table in hand_table(hand_types))
+
+
+@functools.lru_cache(maxsize=None)
+def ultimate_x_table(game):
+    """Ultimate X multiplier earned by each hand type index of game (1 for none)."""
+    return np.array(GAME_ULTIMATE_X[game], dtype=np.int8)
+
+
+def classify_batch(cards, hand_types):
+    """Hand type indexes for an int card array whose last axis holds 5 cards."""
+    _, (keys, types), (flush_keys, flush_types) = hand_table_arrays(hand_types)
+    primes, suit_bits = card_keys(getattr(hand_types, "wild", None))
+    product = np.asarray(primes, dtype=np.int64)[cards].prod(axis=-1)
+    suit_bits = np.asarray(suit_bits, dtype=np.int8)[cards]
+    flush = np.bitwise_and.reduce(suit_bits, axis=-1) != 0
+    result = types[np.searchsorted(keys, product)]
+    result[flush] = flush_types[np.searchsorted(flush_keys, product[flush])]
+    return result
+
+
+def deal_batch(rounds, hands, size, rng):
+    """Random (rounds, 5) sorted dealt hands and (rounds, hands, 5) draws.
+
+    Row h of a round's draws is the order hand h takes replacement cards
+    in: the next five cards of the deck for the first hand and of its own
+    shuffle of the other size - 5 cards for every other hand.
+    """
+    decks = rng.permuted(np.broadcast_to(np.arange(size, dtype=np.int8), (rounds, size)), axis=1)
+    dealt = np.sort(decks[:, :5], axis=1)
+
+    draws = np.empty((rounds, hands, 5), dtype=np.int8)
+    draws[:, 0] = decks[:, 5:10]
+    if hands > 1:
+        others = rng.permuted(np.broadcast_to(decks[:, None, 5:], (rounds, hands - 1, size - 5)), axis=2)
+        draws[:, 1:] = others[:, :, :5]
+    return dealt, draws
+
+
+def simulate_batch(rounds, hands, hand_types, pays, hold, rng, multipliers=None, detail=False, ultimate_x=None):
+    """Deal, draw and evaluate rounds x hands with array operations.
+
+    Deals with deal_batch() and plays the rounds with resolve_batch(),
+    which documents the arguments and results.
+    """
+    dealt, draws = deal_batch(rounds, hands, deck_size(hand_types), rng)
+    return resolve_batch(dealt, draws, hand_types, pays, hold, rng, multipliers, detail, ultimate_x)
+
+
+def resolve_batch(dealt, draws, hand_types, pays, hold, rng, multipliers=None, detail=False, ultimate_x=None):
+    """Play given dealt hands and draw orders with array operations.
+
+    hold(dealt, rng) maps the (rounds, 5) sorted dealt cards to a bool hold
+    mask of the same shape. Every hand keeps the held cards of the dealt
+    hand and fills the discards from its row of draws, in order.
+    multipliers, if given, holds the (hands,) Ultimate X multipliers of the
+    first round and is updated in place to those earned by the last one;
+    ultimate_x is then the game's ultimate_x_table().
+    Returns the per-round payouts in bet units, the (rounds, num types) hand
+    type counts, indexed like hand_table_arrays(hand_types)[0], and the
+    payout and type index of each round's best hand. With detail, also
+    returns a dict of the per-hand arrays: dealt, draws, held, final,
+    types, hand_pays and hand_multipliers (Ultimate X, else 1).
+    """
+    names = hand_table_arrays(hand_types)[0]
+    pays = np.array(pays)
+    rounds = len(dealt)
+    held = hold(dealt, rng)
+
+    # The n-th discarded position takes the n-th replacement card
+    order = np.cumsum(~held, axis=1) - 1
+    order[held] = 0
+    drawn = np.take_along_axis(draws, np.broadcast_to(order[:, None, :], draws.shape), axis=2)
+    final = np.where(held[:, None, :], dealt[:, None, :], drawn)
+
+    types = classify_batch(final, hand_types)
+    hand_pays = pays[types]
+    hand_multipliers = np.ones(types.shape, dtype=np.int8)
+    if multipliers is not None:
+        # Each hand plays at the multiplier its previous round earned
+        earned = ultimate_x[types]
+        hand_multipliers = np.concatenate((multipliers[None], earned[:-1]))
+        hand_pays = hand_pays * hand_multipliers
+        multipliers[:] = earned[-1]
+    payouts = hand_pays.sum(axis=1)
+    counts = (types[:, :, None] == np.arange(len(names))).sum(axis=1)
+    best = hand_pays.argmax(axis=1)
+    rows = np.arange(rounds)
+    if detail:
+        arrays = {
+            "dealt": dealt,
+            "draws": draws,
+            "held": held,
+            "final": final,
+            "types": types,
+            "hand_pays": hand_pays,
+            "hand_multipliers": hand_multipliers,
+        }
+        return payouts, counts, hand_pays[rows, best], types[rows, best], arrays
+    return payouts, counts, hand_pays[rows, best], types[rows, best]
+
+
+# Hold masks: bit i set keeps position i of the sorted dealt hand
+HOLD_MASKS = range(32)
+HOLD_SIZES = [bin(mask).count("1") for mask in HOLD_MASKS]
+BINOM = [[math.comb(n, k) for k in range(6)] for n in range(JOKER + 2)]
+
+
+def colex_rank(cards):
+    """Index of a sorted card combination in colexicographic order."""
+    return sum(BINOM[card][i + 1] for i, card in enumerate(cards))
+
+
+def all_hands(size=len(DECK)):
+    """All C(size, 5) sorted hands as an int8 array in lexicographic order."""
+    count = math.comb(size, 5)
+    flat = np.fromiter(
+        itertools.chain.from_iterable(itertools.combinations(range(size), 5)),
+        dtype=np.int8,
+        count=5 * count,
+    )
+    return flat.reshape(count, 5)
+
+
+@functools.lru_cache(maxsize=None)
+def subset_count_tables(hand_types):
+    """Hand type counts of all hands containing each card subset.
+
+    Entry k is a (C(deck size, k), num types) array indexed by the colex
+    rank of a k-card subset; entry 5 is the type index of each hand by colex
+    rank. Built once per game from a single pass over every hand.
+    """
+    hands = all_hands(deck_size(hand_types))
+    types = classify_batch(hands, hand_types).astype(np.int64)
+    num_types = len(hand_table_arrays(hand_types)[0])
+    binom = np.array(BINOM, dtype=np.int64)
+
+    tables = []
+    for k in range(5):
+        size = math.comb(deck_size(hand_types), k)
+        counts = np.zeros(size * num_types, dtype=np.int64)
+        for positions in itertools.combinations(range(5), k):
+            rank = np.zeros(len(hands), dtype=np.int64)
+            for i, position in enumerate(positions):
+                rank += binom[hands[:, position], i + 1]
+            counts += np.bincount(rank * num_types + types, minlength=size * num_types)
+        tables.append(counts.reshape(size, num_types))
+
+    rank = np.zeros(len(hands), dtype=np.int64)
+    for position in range(5):
+        rank += binom[hands[:, position], position + 1]
+    by_rank = np.empty(len(hands), dtype=np.int64)
+    by_rank[rank] = types
+    tables.append(by_rank)
+    return tables
+
+
+def hold_counts(cards, hand_types):
+    """Final hand type counts for all 32 holds of a sorted 5-card hand.
+
+    Row m counts the draws for HOLD_MASKS[m] over the unseen cards. Hands
+    containing the held set S but none of the discards follow by
+    inclusion-exclusion over the count tables:
+    sum over U >= S of (-1)^|U - S| * N(U), done as a subset Mobius transform.
+    """
+    tables = subset_count_tables(hand_types)
+    num_types = tables[0].shape[1]
+    counts = np.empty((32, num_types), dtype=np.int64)
+    for mask in HOLD_MASKS:
+        subset = [card for i, card in enumerate(cards) if mask >> i & 1]
+        if HOLD_SIZES[mask] == 5:
+            counts[mask] = 0
+            counts[mask, tables[5][colex_rank(subset)]] = 1
+        else:
+            counts[mask] = tables[HOLD_SIZES[mask]][colex_rank(subset)]
+
+    counts = counts.reshape((2,) * 5 + (num_types,))
+    for axis in range(5):
+        # Bit i of the mask is axis 4 - i of the reshaped array
+        without = [slice(None)] * 5
+        with_bit = [slice(None)] * 5
+        without[axis] = 0
+        with_bit[axis] = 1
+        counts[tuple(without)] -= counts[tuple(with_bit)]
+    return counts.reshape(32, num_types)
+
+
+def hold_count(cards, mask, hand_types):
+    """Final hand type counts of the single hold mask of a sorted 5-card hand.
+
+    Same inclusion-exclusion as hold_counts(), summed directly over the
+    supersets of the held cards for callers needing only one row.
+    """
+    tables = subset_count_tables(hand_types)
+    counts = np.zeros(tables[0].shape[1], dtype=np.int64)
+    for superset in HOLD_MASKS:
+        if superset & mask != mask:
+            continue
+        subset = [card for i, card in enumerate(cards) if superset >> i & 1]
+        sign = -1 if (HOLD_SIZES[superset] - HOLD_SIZES[mask]) & 1 else 1
+        if HOLD_SIZES[superset] == 5:
+            counts[tables[5][colex_rank(subset)]] += sign
+        else:
+            counts += sign * tables[HOLD_SIZES[superset]][colex_rank(subset)]
+    return counts
+
+
+def hold_count_batch(hands, held, hand_types):
+    """hold_count() of many sorted hands and their bool (rows, 5) holds."""
+    tables = subset_count_tables(hand_types)
+    hands = np.asarray(hands, dtype=np.int64)
+    binom = np.array(BINOM, dtype=np.int64)
+    masks = (held.astype(np.int64) << np.arange(5)).sum(axis=1)
+    sizes = held.sum(axis=1)
+    counts = np.zeros((len(hands), tables[0].shape[1]), dtype=np.int64)
+    for superset in HOLD_MASKS:
+        rows = np.flatnonzero(superset & masks == masks)
+        positions = [i for i in range(5) if superset >> i & 1]
+        rank = np.zeros(len(rows), dtype=np.int64)
+        for j, position in enumerate(positions):
+            rank += binom[hands[rows, position], j + 1]
+        sign = np.where((HOLD_SIZES[superset] - sizes[rows]) & 1, -1, 1)
+        if HOLD_SIZES[superset] == 5:
+            np.add.at(counts, (rows, tables[5][rank]), sign)
+        else:
+            counts[rows] += sign[:, None] * tables[HOLD_SIZES[superset]][rank]
+    return counts
+
+
+def hold_values(cards, hand_types, values):
+    """Expected value of each of the 32 holds of a sorted hand.
+
+    values gives the value of each hand type index, None (no pay) first.
+    """
+    unseen = deck_size(hand_types) - 5
+    draws = np.array([math.comb(unseen, 5 - size) for size in HOLD_SIZES])
+    return hold_counts(cards, hand_types) @ values / draws
+
+
+def hold_returns(cards, hand_types, pays):
+    """Expected return in bets of each of the 32 holds of a sorted hand."""
+    return hold_values(cards, hand_types, np.array(pays))
+
+
+def canonical_hand(cards):
+    """Suit-isomorphism canonical form of a 5-card hand.
+
+    Suits are relabelled in order of their value bitmasks; suits with equal
+    masks hold the same values, so ties do not change the result. Returns
+    the sorted canonical cards and, for each of them, its position in cards.
+    """
+    masks = [0, 0, 0, 0]
+    for card in cards:
+        if card != JOKER:
+            masks[card % 4] |= 1 << (card // 4)
+    order = sorted(range(4), key=masks.__getitem__, reverse=True)
+    new_suit = [0] * 4
+    for label, suit in enumerate(order):
+        new_suit[suit] = label
+    canon = [card - card % 4 + new_suit[card % 4] if card != JOKER else card for card in cards]
+    positions = sorted(range(len(cards)), key=canon.__getitem__)
+    return [canon[i] for i in positions], positions
+
+
+def canonical_batch(hands):
+    """Array form of canonical_hand() for an (N, 5) int array of hands.
+
+    Returns (ranks, positions): the colex rank of each canonical hand and the
+    (N, 5) original positions of its sorted cards.
+    """
+    hands = np.asarray(hands, dtype=np.int64)
+    vals = hands // 4
+    suits = hands % 4
+    natural = hands != JOKER
+    bits = np.left_shift(1, vals) * natural
+    masks = np.stack([(bits * (suits == suit)).sum(axis=1) for suit in range(4)], axis=1)
+    order = np.argsort(-masks, axis=1, kind="stable")
+    new_suit = np.argsort(order, axis=1)
+    canon = np.where(natural, vals * 4 + np.take_along_axis(new_suit, suits, axis=1), hands)
+    positions = np.argsort(canon, axis=1)
+    canon = np.take_along_axis(canon, positions, axis=1)
+    binom = np.array(BINOM, dtype=np.int64)
+    ranks = sum(binom[canon[:, i], i + 1] for i in range(5))
+    return ranks, positions
+
+
+@functools.lru_cache(maxsize=None)
+def canonical_classes(size=len(DECK)):
+    """The suit-isomorphism classes of dealt hands (134,459 for 52 cards).
+
+    Returns (ranks, hands, weights): the colex rank of each canonical hand,
+    its sorted cards and the number of dealt hands in the class.
+    """
+    hands = all_hands(size)
+    ranks, _ = canonical_batch(hands)
+    ranks, first, weights = np.unique(ranks, return_index=True, return_counts=True)
+    canon_hands = [canonical_hand(cards)[0] for cards in hands[first].tolist()]
+    return ranks, canon_hands, weights
+
+
+def hand_payout_distribution(counts, draws, pays):
+    """Payout distribution in bets of one hand from a hold's type counts."""
+    return np.bincount(pays, weights=np.asarray(counts) / draws, minlength=pays.max() + 1)
+
+
+def convolve_power(dist, power):
+    """Distribution of the sum of power independent draws from dist.
+
+    Both paths use binary powering: direct convolutions for few hands and,
+    from FFT_MIN_HANDS on, products of a single spectrum sized for the sum.
+    """
+    if power < FFT_MIN_HANDS:
+        multiply = np.convolve
+        base = dist
+    else:
+        size = (len(dist) - 1) * power + 1
+        n = 1 << (size - 1).bit_length()
+        multiply = np.multiply
+        base = np.fft.rfft(dist, n)
+    result = None
+    while power:
+        if power & 1:
+            result = base if result is None else multiply(result, base)
+        power >>= 1
+        if power:
+            base = multiply(base, base)
+    if multiply is np.convolve:
+        return result
+    return np.clip(np.fft.irfft(result, n)[:size], 0, None)
+
+
+@functools.lru_cache(maxsize=4096)
+def round_payout_split(outcome, pays, hands, big_pay=BIG_PAY):
+    """Distributions to sample one round's payout in bets over hands hands.
+
+    outcome is (number of draws, type counts...) of the shared hold and pays
+    the paytable vector as a tuple. Hands paying big_pay or more are rare,
+    so a round is sampled as its number of big hits, the payout of each hit
+    from big_pay up and the total of the other hands. Returns the first two
+    as unnormalized cdfs and the per-hand distribution below big_pay.
+    """
+    draws, *counts = outcome
+    dist = hand_payout_distribution(counts, draws, np.array(pays))
+    hit = dist[big_pay:].sum()
+    hits = convolve_power(np.array([1 - hit, hit]), hands)
+    return np.cumsum(hits), np.cumsum(dist[big_pay:]), dist[:big_pay]
+
+
+@functools.lru_cache(maxsize=4096)
+def round_small_cdf(outcome, pays, hands, big_pay=BIG_PAY):
+    """Unnormalized cdf of the total payout of hands hands below big_pay."""
+    small = round_payout_split(outcome, pays, 1, big_pay)[2]
+    return np.cumsum(convolve_power(small / small.sum(), hands))
+
+
+def super_times_distribution(prob, multipliers):
+    """Round multiplier distribution of Super Times Pay.
+
+    A round triggers with probability prob and then draws one of the equally
+    likely multipliers; otherwise it pays 1x. Returns (values, probs).
+    """
+    values, counts = np.unique(np.array(multipliers), return_counts=True)
+    probs = counts * (prob / len(multipliers))
+    if values[0] != 1:
+        values = np.concatenate(([1], values))
+        probs = np.concatenate(([0.0], probs))
+    probs[0] += 1 - prob
+    return values, probs
+
+
+def scale_mixture(dist, values, probs, scale=1):
+    """Distribution of m * x * scale for x ~ dist and m = values[k] w.p. probs[k]."""
+    mixture = np.zeros((len(dist) - 1) * values.max() * scale + 1)
+    for value, prob in zip(values.tolist(), probs):
+        mixture[:: value * scale][: len(dist)] += prob * dist
+    return mixture
+
+
+# Low bits of a strategy table entry holding the hold mask
+STRATEGY_HOLD_BITS = 5
+
+
+def strategy_table_path(strategy_dir, game):
+    return os.path.join(strategy_dir, "strategy_%s.npy" % game)
+
+
+def build_strategy_table(hand_types, pays):
+    """Best hold of every canonical hand, packed as colex rank << 5 | hold.
+
+    Only the canonical hands are solved (with hold_returns) and stored, in
+    rank order, so strategy_holds() finds them by binary search. Hold bits
+    refer to the sorted canonical cards.
+    """
+    ranks, canon_hands, _ = canonical_classes(deck_size(hand_types))
+    holds = np.empty(len(canon_hands), dtype=np.uint32)
+    for i, cards in enumerate(canon_hands):
+        holds[i] = hold_returns(cards, hand_types, pays).argmax()
+        if (i + 1) % 10000 == 0:
+            print("Strategy table: %d / %d hands" % (i + 1, len(canon_hands)))
+    return ranks.astype(np.uint32) << STRATEGY_HOLD_BITS | holds
+
+
+@functools.lru_cache(maxsize=None)
+def load_strategy_table(path):
+    # Still backed by the file mapping, without np.memmap's per-call overhead
+    table = np.load(path, mmap_mode="r").view(np.ndarray)
+    if table.dtype != np.uint32:
+        raise ValueError("%s is an old rank-indexed strategy table; rebuild it with --build_strategy" % path)
+    return table
+
+
+def strategy_holds(table, ranks):
+    """Hold masks of canonical hands by colex rank from a build_strategy_table() table."""
+    # Keys must match the table's uint32, or searchsorted casts the whole table
+    keys = np.uint32(ranks << STRATEGY_HOLD_BITS)
+    return table[table.searchsorted(keys)] & (1 << STRATEGY_HOLD_BITS) - 1
+
+
+def partial_shuffle(deck, start, num, uniforms):
+    """Partial Fisher-Yates: move num random cards of deck[start:] into
+    deck[start:start + num] in place and return them.
+
+    Each selection is uniform over the cards still at or after its slot,
+    whatever order the deck buffer was left in by earlier draws.
+    """
+    for i, u in zip(range(start, start + num), uniforms):
+        j = i + int(u * (len(deck) - i))
+        deck[i], deck[j] = deck[j], deck[i]
+    return deck[start : start + num]
+
+
+class GameRandom(object):
+    """Per-simulation random source.
+
+    "random" wraps a private random.Random. "pcg64" and "philox" pre-generate
+    RNG_BLOCK uniforms at a time from a NumPy bit generator and serve draws
+    from that buffer. Either way, generator is a NumPy Generator seeded from
+    the same seed for the batch engine, built on first use.
+    """
+
+    def __init__(self, seed=None, backend="random"):
+        self.backend = backend
+        self.seed = seed
+        if backend == "random":
+            self.random_state = random.Random(seed)
+            self.random = self.random_state.random
+        else:
+            bit_generators = {"pcg64": np.random.PCG64, "philox": np.random.Philox}
+            self.generator = np.random.Generator(bit_generators[backend](seed))
+            self.buffer = []
+            self.next_index = 0
+
+    @functools.cached_property
+    def generator(self):
+        # Only the batch engine and sampled paths need it with "random"
+        return np.random.default_rng(self.seed)
+
+    def uniforms(self, num):
+        """The next num uniform draws in [0, 1) as a list."""
+        if self.backend == "random":
+            return [self.random() for _ in range(num)]
+        if self.next_index + num > len(self.buffer):
+            self.buffer = self.buffer[self.next_index :] + self.generator.random(
+                max(RNG_BLOCK, num)
+            ).tolist()
+            self.next_index = 0
+        start = self.next_index
+        self.next_index += num
+        return self.buffer[start : self.next_index]
+
+    def random(self):
+        return self.uniforms(1)[0]
+
+    def choice(self, seq):
+        if self.backend == "random":
+            return self.random_state.choice(seq)
+        return seq[int(self.random() * len(seq))]
+
+    def shuffle(self, x):
+        if self.backend == "random":
+            self.random_state.shuffle(x)
+            return
+        # Fisher-Yates driven by one bulk draw per shuffle
+        for i, u in zip(range(len(x) - 1, 0, -1), self.uniforms(len(x) - 1)):
+            j = int(u * (i + 1))
+            x[i], x[j] = x[j], x[i]
+
+    def sample(self, population, k):
+        if self.backend == "random":
+            return self.random_state.sample(population, k)
+        pool = list(population)
+        for i, u in enumerate(self.uniforms(k)):
+            j = i + int(u * (len(pool) - i))
+            pool[i], pool[j] = pool[j], pool[i]
+        return pool[:k]
+
+
+class BalanceHistory(object):
+    """Per-round balance trajectory of a session.
+
+    Rounds are kept in typed array('d') buffers that grow on demand; only
+    every stride-th round is kept. With a path, rows of (step, balance,
+    delta) doubles are also streamed to that file, and keep=False skips the
+    in-memory buffers entirely.
+    """
+
+    def __init__(self, stride=1, path=None, keep=True):
+        self.stride = stride
+        self.keep = keep
+        self.steps = array("d")
+        self.balances = array("d")
+        self.deltas = array("d")
+        self.file = open(path, "wb") if path else None
+
+    def record(self, step, balance, delta):
+        if step % self.stride:
+            return
+        if self.keep:
+            self.steps.append(step)
+            self.balances.append(balance)
+            self.deltas.append(delta)
+        if self.file is not None:
+            self.file.write(array("d", (step, balance, delta)).tobytes())
+
+    def record_many(self, steps, balances, deltas):
+        kept = steps % self.stride == 0
+        rows = np.stack([steps[kept], balances[kept], deltas[kept]], axis=1).astype(np.float64)
+        if self.keep:
+            self.steps.extend(rows[:, 0].tolist())
+            self.balances.extend(rows[:, 1].tolist())
+            self.deltas.extend(rows[:, 2].tolist())
+        if self.file is not None:
+            self.file.write(rows.tobytes())
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class EventLog(object):
+    """Streaming record file: per-hand EVENT_FIELDS audit trails, or the
+    deck_fields() dealt hands and draw orders of --record_decks.
+
+    The file starts with EVENT_MAGIC, a little-endian uint32 length and a
+    JSON header (field layout and the caller's session details) padded to
+    EVENT_HEADER_ALIGN bytes; fixed-width records follow. Scalar rounds are
+    packed into a bytearray and written once it holds EVENT_BUFFER_BYTES;
+    batch passes write whole structured arrays.
+    """
+
+    def __init__(self, path, header, fields=EVENT_FIELDS):
+        self.file = open(path, "wb")
+        header = dict(header, fields=fields, record_size=event_dtype(fields).itemsize)
+        encoded = json.dumps(header).encode()
+        size = len(EVENT_MAGIC) + 4 + len(encoded)
+        encoded += b" " * (-size % EVENT_HEADER_ALIGN)
+        self.file.write(EVENT_MAGIC + struct.pack("<I", len(encoded)) + encoded)
+        self.buffer = bytearray()
+
+    def record(self, rows):
+        """Buffer EVENT_STRUCT-packed rows."""
+        self.buffer += rows
+        if len(self.buffer) >= EVENT_BUFFER_BYTES:
+            self.flush()
+
+    def record_many(self, records):
+        """Write a structured array of the file's event_dtype() records."""
+        self.flush()
+        self.file.write(records.tobytes())
+
+    def flush(self):
+        if self.buffer:
+            self.file.write(self.buffer)
+            self.buffer = bytearray()
+
+    def close(self):
+        if self.file is not None:
+            self.flush()
+            self.file.close()
+            self.file = None
+
+
+def event_dtype(fields=EVENT_FIELDS):
+    return np.dtype([tuple(tuple(item) if isinstance(item, list) else item for item in field) for field in fields])
+
+
+def deck_fields(hands):
+    """--record_decks record: sorted dealt cards and each hand's draw order."""
+    return [("dealt", "u1", (5,)), ("draws", "u1", (hands, 5))]
+
+
+def read_event_log(path):
+    """(header dict, memory-mapped record array) of an --event_log or
+    --record_decks file; the record layout comes from the header."""
+    with open(path, "rb") as file:
+        if file.read(len(EVENT_MAGIC)) != EVENT_MAGIC:
+            raise ValueError("%s is not an event log" % path)
+        (length,) = struct.unpack("<I", file.read(4))
+        header = json.loads(file.read(length))
+    dtype = event_dtype(header["fields"])
+    offset = len(EVENT_MAGIC) + 4 + length
+    if os.path.getsize(path) == offset:
+        return header, np.zeros(0, dtype=dtype)
+    return header, np.memmap(path, dtype=dtype, mode="r", offset=offset)
+
+
 # MAIN CLASS
 class VideoPokerSimulation(object):
-    def __init__(self, args):
+    def __init__(self, args, seed=None):
+        self.seed = seed
+        self.rng = GameRandom(seed, args.rng)
         self.debug = args.debug
         self.alg = args.alg
         self.game = args.game
@@ -410,25 +1313,26 @@ class VideoPokerSimulation(object):
         self.hands = args.hands
         self.plot = args.plot
         self.multi = args.multi
+        self.batch = args.batch
+        self.sample_rounds = args.sample_rounds
+        self.super_times = super_times_distribution(args.supt_prob, args.supt_multipliers) if self.multi == "supt" else None
+        # Ultimate X multipliers each hand plays at next round
+        self.multipliers = np.ones(self.hands, dtype=np.int8) if self.multi == "ultx" else None
+        # Compiled paytable: hand types evaluate to indexes into these
+        hand_types, self.pays = GAME_TYPES[self.game]
+        self.type_names = hand_type_names(hand_types)
+        self.type_tables = hand_index_table(hand_types)
+        self.type_counts = [0] * len(self.type_names)
+        self.ultimate_x = ultimate_x_table(self.game).tolist() if self.multi == "ultx" else None
+        self.strategy_dir = args.strategy_dir
         self.exit = args.exit
         self.reduce_bet = args.reduce_bet
-        self.max_balance = copy.deepcopy(args.stack)
-        self.init_balance = copy.deepcopy(args.stack)
-        self.shuffled_cards = None
-        self.group = {}
-        self.prev_group = {}
-        self.group[0] = {
-            "cards": [],
-            "vals": [],
-            "cats": [],
-            "d_vals": [],
-            "d_cats": [],
-            "type": None,
-            "ret": 0,
-            "multi": 1,
-        }
-        for i in range(1, self.hands):
-            self.group[i] = copy.deepcopy(self.group[0])
+        self.max_balance = args.stack
+        self.init_balance = args.stack
+        self.deck = list(range(deck_size(hand_types)))
+        self.card_primes, self.card_suit_bits = card_keys(hand_types.wild)
+        # Per-hand records are allocated once and updated in place every round
+        self.group = [Hand() for _ in range(self.hands)]
         self.keep = None
         self.max_ret = 0
         self.max_group = {"type": None, "profit": 0, "num_steps": 0, "balance": 0}
@@ -438,28 +1342,32 @@ class VideoPokerSimulation(object):
             "k": self.algorithm_keep_all,
             "d": self.algorithm_discard_all,
             "s1": self.algorithm_strategy1,
+            "ev": self.algorithm_ev,
+            "st": self.algorithm_table,
         }
         self.algorithm = self.algorithms[self.alg]
-        self.hist = {
-                "RF": 0,
-                "SF": 0,
-                "4KA_2_4": 0,
-                "4K2_4_A_4": 0,
-                "4KA": 0,
-                "4K2_4": 0,
-                "4K": 0,
-                "FH": 0,
-                "F": 0,
-                "S": 0,
-                "3K": 0,
-                "2P": 0,
-                "JoB": 0,
-            }
+        self.hist = dict.fromkeys(self.type_names[1:], 0)
 
         self.num_steps = 0
         self.prev_balance = 0
-        self.balance_list = [0] * 100000
-        self.delta_balance_list = [0] * 100000
+        # Balance history is only recorded when something will read it
+        self.history = None
+        if self.plot or args.history_file:
+            self.history = BalanceHistory(args.history_stride, args.history_file, self.plot)
+        self.events = None
+        if args.event_log:
+            self.type_ids = {name: index for index, name in enumerate(self.type_names)}
+            self.events = EventLog(
+                args.event_log,
+                {"game": self.game, "types": self.type_names, "hands": self.hands, "bet_denom": self.bet_denom, "seed": seed},
+            )
+        self.decks = None
+        if args.record_decks:
+            self.decks = EventLog(
+                args.record_decks,
+                {"game": self.game, "deck_size": len(self.deck), "hands": self.hands, "seed": seed},
+                deck_fields(self.hands),
+            )
         self.init_bet_denom = self.bet_denom
         
 
@@ -469,13 +1377,15 @@ class VideoPokerSimulation(object):
             keep = self.algorith_random()
         elif keep == "s1":
             keep = self.algorithm_strategy1()
+        elif keep == "ev":
+            keep = self.algorithm_ev()
         return keep
 
     def algorith_random(self):
         if self.debug:
             print("Algorithm Random:")
-        num_choices = random.choice(NUM_CARDS)
-        keep_list = random.sample(NUM_CARDS, num_choices)
+        num_choices = self.rng.choice(NUM_CARDS)
+        keep_list = self.rng.sample(NUM_CARDS, num_choices)
         keep_list_str = [str(x) for x in keep_list]
         keep = "".join(keep_list_str)
         return keep
@@ -493,7 +1403,7 @@ class VideoPokerSimulation(object):
             print("Algorithm Strategy 1:")
         keep = ""
         # Check for Straight Flushes:
-        if self.group[0]["d_cats"] == FLUSH and self.group[0]["d_vals"] in (
+        if self.group[0].d_cats == FLUSH and self.group[0].d_vals in (
             STRAIGHT,
             AL_STRAIGHT,
         ):
@@ -501,17 +1411,17 @@ class VideoPokerSimulation(object):
 
         # Check for Quads
         if keep == "":
-            if self.group[0]["d_vals"] == [0, 0, 0]:
+            if self.group[0].d_vals == [0, 0, 0]:
                 keep = "12345"
 
         # Check for Full Houses:
         if keep == "":
             if (
-                self.group[0]["d_vals"][:2] == [0, 0]
-                and self.group[0]["d_vals"][3] == 0
+                self.group[0].d_vals[:2] == [0, 0]
+                and self.group[0].d_vals[3] == 0
             ):
                 keep = "12345"
-            elif self.group[0]["d_vals"][0] == 0 and self.group[0]["d_vals"][2:] == [
+            elif self.group[0].d_vals[0] == 0 and self.group[0].d_vals[2:] == [
                 0,
                 0,
             ]:
@@ -519,23 +1429,23 @@ class VideoPokerSimulation(object):
 
         # Check for Straights or Flushes
         if keep == "":
-            if self.group[0]["d_cats"] == FLUSH:
+            if self.group[0].d_cats == FLUSH:
                 keep = "12345"
-            elif self.group[0]["d_vals"] in (STRAIGHT, AL_STRAIGHT):
+            elif self.group[0].d_vals in (STRAIGHT, AL_STRAIGHT):
                 keep = "12345"
 
         # Check for Trips
         if keep == "":
-            if self.group[0]["d_vals"][:2] == [0, 0]:
+            if self.group[0].d_vals[:2] == [0, 0]:
                 keep = "123"
-            if self.group[0]["d_vals"][1:3] == [0, 0]:
+            if self.group[0].d_vals[1:3] == [0, 0]:
                 keep = "234"
-            if self.group[0]["d_vals"][2:] == [0, 0]:
+            if self.group[0].d_vals[2:] == [0, 0]:
                 keep = "345"
 
         # Check for Pairs
         if keep == "":
-            for i, x in enumerate(self.group[0]["d_vals"]):
+            for i, x in enumerate(self.group[0].d_vals):
                 if x == 0 and i < 4:
                     if str(i + 1) not in keep:
                         keep += str(i + 1)
@@ -544,33 +1454,33 @@ class VideoPokerSimulation(object):
 
         if keep == "":
             # Check for 4 to a Flush
-            if self.group[0]["d_cats"][:3] == FOUR_TO_A_FLUSH:
+            if self.group[0].d_cats[:3] == FOUR_TO_A_FLUSH:
                 keep = "1234"
 
-            elif self.group[0]["d_cats"][1:] == FOUR_TO_A_FLUSH:
+            elif self.group[0].d_cats[1:] == FOUR_TO_A_FLUSH:
                 keep = "2345"
 
             # Check for 4 to a Straight
-            elif self.group[0]["d_cats"][:3] == FOUR_TO_A_STRIGHT:
+            elif self.group[0].d_vals[:3] == FOUR_TO_A_STRIGHT:
                 keep = "1234"
 
-            elif self.group[0]["d_cats"][1:] in (FOUR_TO_A_STRIGHT, FOUR_TO_A_STRIGHT2):
+            elif self.group[0].d_vals[1:] in (FOUR_TO_A_STRIGHT, FOUR_TO_A_STRIGHT2):
                 keep = "2345"
 
             # Check for 3 to a Royal Flush
             elif (
-                self.group[0]["vals"][:3] in THREE_TO_RF
-                and self.group[0]["d_cats"][:2] == THREE_TO_A_FLUSH
+                self.group[0].vals[:3] in THREE_TO_RF
+                and self.group[0].d_cats[:2] == THREE_TO_A_FLUSH
             ):
                 keep = "123"
             elif (
-                self.group[0]["vals"][1:4] in THREE_TO_RF
-                and self.group[0]["d_cats"][1:3] == THREE_TO_A_FLUSH
+                self.group[0].vals[1:4] in THREE_TO_RF
+                and self.group[0].d_cats[1:3] == THREE_TO_A_FLUSH
             ):
                 keep = "234"
             elif (
-                self.group[0]["vals"][2:] in THREE_TO_RF
-                and self.group[0]["d_cats"][2:] == THREE_TO_A_FLUSH
+                self.group[0].vals[2:] in THREE_TO_RF
+                and self.group[0].d_cats[2:] == THREE_TO_A_FLUSH
             ):
                 keep = "345"
 
@@ -579,12 +1489,12 @@ class VideoPokerSimulation(object):
                 num_cards = 0
                 suits = []
                 vals = []
-                for i, card in enumerate(self.group[0]["cards"]):
-                    if CARDS[card]["val"] > 10:
+                for i, card in enumerate(self.group[0].cards):
+                    if CARD_VALS[card] > 10:
                         keep += str(i + 1)
                         num_cards += 1
-                        suits.append(self.group[0]["cats"][i])
-                        vals.append(self.group[0]["vals"][i])
+                        suits.append(self.group[0].cats[i])
+                        vals.append(self.group[0].vals[i])
 
                 if len(keep) == 3:
                     #print("Debug: 3 High Cards:", vals, suits)
@@ -597,96 +1507,154 @@ class VideoPokerSimulation(object):
 
         return keep
 
+    def algorithm_ev(self):
+        # Hold with the highest exact expected return over the unseen cards
+        hand_types, pays = GAME_TYPES[self.game]
+        if self.multi == "ultx":
+            # Pays at this round's average multiplier plus the value of the
+            # multiplier each final hand earns for the next round
+            values = self.multipliers.mean() * np.array(pays) + ULTIMATE_X_UNIT_VALUE * (ultimate_x_table(self.game) - 1)
+            evs = hold_values(self.group[0].cards, hand_types, values)
+        else:
+            evs = hold_returns(self.group[0].cards, hand_types, pays)
+        mask = int(evs.argmax())
+        keep = "".join(str(card) for card in NUM_CARDS if mask >> (card - 1) & 1)
+        if self.debug:
+            print("Algorithm EV:", keep, "Expected Return", evs[mask])
+        return keep
+
+    def algorithm_table(self):
+        # Precomputed best hold of the canonical form of the dealt hand
+        table = load_strategy_table(strategy_table_path(self.strategy_dir, self.game))
+        canon, positions = canonical_hand(self.group[0].cards)
+        mask = int(strategy_holds(table, colex_rank(canon)))
+        held = sorted(positions[i] for i in range(5) if mask >> i & 1)
+        keep = "".join(str(i + 1) for i in held)
+        if self.debug:
+            print("Algorithm Strategy Table:", keep)
+        return keep
+
+    def keep_mask(self, keep):
+        if keep in ALL:
+            keep = ALL_CARDS
+        elif keep in NONE:
+            keep = NO_CARDS
+        return [str(card) in keep for card in NUM_CARDS]
+
+    def hold_masks(self, dealt, rng):
+        # Batch hold decisions; strategies without an array form run per round
+        rounds = len(dealt)
+        if self.alg == "k":
+            return np.ones((rounds, 5), dtype=bool)
+        if self.alg == "d":
+            return np.zeros((rounds, 5), dtype=bool)
+        if self.alg == "r":
+            num_choices = rng.integers(1, 6, size=rounds)
+            positions = rng.random((rounds, 5)).argsort(axis=1).argsort(axis=1)
+            return positions < num_choices[:, None]
+        if self.alg == "st":
+            table = load_strategy_table(strategy_table_path(self.strategy_dir, self.game))
+            ranks, positions = canonical_batch(dealt)
+            bits = (strategy_holds(table, ranks)[:, None] >> np.arange(5)) & 1
+            held = np.zeros((rounds, 5), dtype=bool)
+            np.put_along_axis(held, positions, bits.astype(bool), axis=1)
+            return held
+
+        held = np.zeros((rounds, 5), dtype=bool)
+        for r in range(rounds):
+            self.group[0].cards = dealt[r].tolist()
+            self.group[0].update()
+            held[r] = self.keep_mask(self.algorithm())
+        return held
+
     def deal(self):
         
         # Bet Payment
-        self.prev_balance = copy.deepcopy(self.balance)
+        self.prev_balance = self.balance
         self.balance = self.balance - self.hands * self.bet_denom
 
         if self.keep in QUIT:
             return
-        cards = copy.deepcopy(CARDS_KEYS)
+        partial_shuffle(self.deck, 0, 5, self.rng.uniforms(5))
+        self.group[0].cards[:] = self.deck[:5]
 
-        random.shuffle(cards)
+        # -a i can hand off to s1 or ev, which read the sorted hand
+        if self.alg in ("s1", "ev", "st", "i"):
+            self.group[0].update()
 
-        self.shuffled_cards = copy.deepcopy(cards[:10])
-        self.group[0]["cards"] = copy.deepcopy(self.shuffled_cards[:5])
-
-        
+        if self.alg == "i":
+            print("\nInitial Group:", " ".join(card_names(self.group[0].cards)))
 
-        if self.alg in ("s1",):
-            self.group[0]["cards"].sort()
-            self.group[0]["vals"] = [CARDS[x]["val"] for x in self.group[0]["cards"]]
-            self.group[0]["vals"].sort()
-            self.group[0]["cats"] = [CARDS[x]["cat"] for x in self.group[0]["cards"]]
-            self.group[0]["cats"].sort()
-            self.group[0]["d_vals"] = [
-                x - self.group[0]["vals"][i - 1]
-                for i, x in enumerate(self.group[0]["vals"])
-            ][1:]
-            self.group[0]["d_cats"] = [
-                x - self.group[0]["cats"][i - 1]
-                for i, x in enumerate(self.group[0]["cats"])
-            ][1:]
+    def sample_cdf(self, cdf):
+        # Index drawn from an unnormalized cumulative distribution
+        return int(np.searchsorted(cdf, self.rng.random() * cdf[-1], side="right"))
 
-        if self.alg == "i":
-            print("\nInitial Group:", " ".join([x[2:] for x in self.group[0]["cards"]]))
-
-        # multiple
-        self.other_shuffled_cards = {}
-        for index in range(1, self.hands):
-            shuffled_cards_5_52 = copy.deepcopy(cards[5:])
-            random.shuffle(shuffled_cards_5_52)
-            self.group[index]["cards"] = copy.deepcopy(self.group[0]["cards"])
-            self.other_shuffled_cards[index] = (
-                self.group[index]["cards"] + shuffled_cards_5_52[:5]
-            )
+    def sample_round(self):
+        # Sample the round's total payout from the exact distribution of the
+        # hold instead of drawing and evaluating every hand
+        self.keep = self.algorithm()
+        if self.debug:
+            print("Keep", self.keep)
+        if self.keep in QUIT:
+            return
 
-        
+        held = self.keep_mask(self.keep)
+        cards = self.group[0].cards
+        positions = sorted(range(5), key=cards.__getitem__)
+        mask = sum(1 << i for i, position in enumerate(positions) if held[position])
+        hand_types = GAME_TYPES[self.game][0]
+        counts = hold_count([cards[position] for position in positions], mask, hand_types)
+        outcome = (math.comb(len(self.deck) - 5, 5 - HOLD_SIZES[mask]),) + tuple(counts.tolist())
+        # -e r stops on the multiplied pay, so big hits start at BIG_PAY / multi
+        big_pay = -(-BIG_PAY // self.group[0].multi)
+        hits_cdf, big_cdf, _ = round_payout_split(outcome, self.pays, self.hands, big_pay)
+        hits = self.sample_cdf(hits_cdf)
+        big = [big_pay + self.sample_cdf(big_cdf) for _ in range(hits)]
+        payout = sum(big)
+        if hits < self.hands:
+            payout += self.sample_cdf(round_small_cdf(outcome, self.pays, self.hands - hits, big_pay))
+        if big and max(big) * self.group[0].multi * self.bet_denom > self.max_ret:
+            self.max_ret = max(big) * self.group[0].multi * self.bet_denom
+
+        ret = payout * self.group[0].multi * self.bet_denom
+        self.balance += ret
+        if self.balance > self.max_balance:
+            self.max_balance = self.balance
+        if self.debug:
+            print("Sampled Round Ret", ret)
 
     def update_multiplier(self):
 
         if self.multi == "supt":
 
-            self.balance = self.balance - self.bet_denom * self.hands * 0.2
+            self.balance = self.balance - self.bet_denom * self.hands * SUPER_T_COST
             if self.balance <= 0:
                 return
-            multipler = 1
-            if random.choice(SUPER_T_TIMER) == 14:
-                random.shuffle(SUPER_T_MULTIPLER)
-
-                if self.alg == "i":
-                    print("Super Time Pay: Multiplier Spin!")
-                    for m in SUPER_T_MULTIPLER:
-                        time.sleep(0.2)
-                        print(m)
-
-                    print("   Multiplier = ", multipler)
-
-                multipler = SUPER_T_MULTIPLER[-1]
+            values, probs = self.super_times
+            multipler = int(values[self.sample_cdf(np.cumsum(probs))])
+            if self.alg == "i" and multipler > 1:
+                print("Super Time Pay: Multiplier = ", multipler)
 
             for index in range(self.hands):
-                self.group[index]["multi"] = multipler
+                self.group[index].multi = multipler
 
         elif self.multi == "ultx":
+            # Ultimate X doubles the bet; each hand plays at the multiplier
+            # its result in the previous round earned
             self.balance = self.balance - self.bet_denom * self.hands
             if self.balance <= 0:
                 return
-            for index in range(self.hands):
-                self.group[index]["multi"] = 1
-                if self.group[index]["type"] in ULTIMATE_X_MULTIPLIER:
-                    self.group[index]["multi"] = ULTIMATE_X_MULTIPLIER[
-                        self.group[index]["type"]
-                    ]
-                if self.alg == "i":
-                    print("Ultimate X: Multiplier = ", self.group[index]["multi"])
+            for hand, multiplier in zip(self.group, self.multipliers.tolist()):
+                hand.multi = multiplier
+            if self.alg == "i":
+                print("Ultimate X: Multipliers = ", " ".join(str(m) for m in self.multipliers))
 
     def draw(self):
         if self.keep in QUIT:
             return
 
         if self.debug:
-            print("Step", self.num_steps, "Shuffled cards", self.shuffled_cards)
+            print("Step", self.num_steps, "Dealt cards", card_names(self.group[0].cards, short=False))
 
         self.keep = self.algorithm()
         if self.debug:
@@ -701,197 +1669,82 @@ class VideoPokerSimulation(object):
         elif self.keep in NONE:
             self.keep = NO_CARDS
 
-        next_card = 5
-
-        for card in NUM_CARDS:
-            card_str = str(card)
-
-            if card_str not in self.keep:
-                self.group[0]["cards"][card - 1] = self.shuffled_cards[next_card]
-
-                for i in range(1, self.hands):
-                    self.group[i]["cards"][card - 1] = self.other_shuffled_cards[i][
-                        next_card
-                    ]
-
-                next_card += 1
-
-        self.group[0]["cards"].sort()
-        self.group[0]["vals"] = [CARDS[x]["val"] for x in self.group[0]["cards"]]
-        self.group[0]["vals"].sort()
-        self.group[0]["cats"] = [CARDS[x]["cat"] for x in self.group[0]["cards"]]
-        self.group[0]["cats"].sort()
-        self.group[0]["d_vals"] = [
-            x - self.group[0]["vals"][i - 1]
-            for i, x in enumerate(self.group[0]["vals"])
-        ][1:]
-        self.group[0]["d_cats"] = [
-            x - self.group[0]["cats"][i - 1]
-            for i, x in enumerate(self.group[0]["cats"])
-        ][1:]
-
-        for i in range(1, self.hands):
-
-            self.group[i]["cards"].sort()
-            self.group[i]["vals"] = [CARDS[x]["val"] for x in self.group[i]["cards"]]
-            # self.group[i]["vals"].sort()
-            self.group[i]["cats"] = [CARDS[x]["cat"] for x in self.group[i]["cards"]]
-            # self.group[i]["cats"].sort()
-            self.group[i]["d_vals"] = [
-                x - self.group[i]["vals"][j - 1]
-                for j, x in enumerate(self.group[i]["vals"])
-            ][1:]
-            self.group[i]["d_cats"] = [
-                x - self.group[i]["cats"][j - 1]
-                for j, x in enumerate(self.group[i]["cats"])
-            ][1:]
+        # Every hand keeps the held cards and draws its own replacements
+        # from the undealt cards at self.deck[5:]
+        discards = [card - 1 for card in NUM_CARDS if str(card) not in self.keep]
+        num_draws = len(discards)
+        uniforms = self.rng.uniforms(num_draws * self.hands)
+        dealt = self.group[0].cards[:]
+        for index in range(self.hands):
+            cards = self.group[index].cards
+            cards[:] = dealt
+            replacements = partial_shuffle(
+                self.deck, 5, num_draws, uniforms[index * num_draws : (index + 1) * num_draws]
+            )
+            for position, card in zip(discards, replacements):
+                cards[position] = card
 
-        if self.debug:
-            print("Updated Group:", " ".join([x[2:] for x in self.group[0]["cards"]]))
+        # Evaluation only needs the cards; values are derived for display
+        for i in range(self.hands):
+            self.group[i].cards.sort()
 
         if self.debug:
-            print("Values", self.group[0]["vals"])
-            print("Values Diffs", self.group[0]["d_vals"])
-            print("Categories", self.group[0]["cats"])
-            print("Categories Diffs", self.group[0]["d_cats"])
-
-    def evaluate_job(self, index):
-
-        self.group[index]["type"] = None
-        self.group[index]["ret"] = 0
-
-        if is_rf(self.group[index]):
-            self.group[index]["type"] = "RF"
-        elif is_sf(self.group[index]):
-            self.group[index]["type"] = "SF"
-        elif is_4k(self.group[index]):
-            self.group[index]["type"] = "4K"
-        elif is_fh(self.group[index]):
-            self.group[index]["type"] = "FH"
-        elif is_f(self.group[index]):
-            self.group[index]["type"] = "F"
-        elif is_s(self.group[index]):
-            self.group[index]["type"] = "S"
-        elif is_3k(self.group[index]):
-            self.group[index]["type"] = "3K"
-        elif is_2p(self.group[index]):
-            self.group[index]["type"] = "2P"
-        elif is_job(self.group[index]):
-            self.group[index]["type"] = "JoB"
-
-        if self.group[index]["type"] in RETURNS_KEYS3:
-            self.group[index]["ret"] = (
-                self.group[index]["multi"]
-                * RETURNS_JoB[self.group[index]["type"]]
-                * self.bet_denom
-            )
-            self.hist[self.group[index]["type"]] += 1
-
-    def evaluate_db(self, index):
-
-        self.group[index]["type"] = None
-        self.group[index]["ret"] = 0
-
-        if is_rf(self.group[index]):
-            self.group[index]["type"] = "RF"
-        elif is_4ka(self.group[index]):
-            self.group[index]["type"] = "4KA"
-        elif is_4k2_4(self.group[index]):
-            self.group[index]["type"] = "4K2_4"
-        elif is_4k(self.group[index]):
-            self.group[index]["type"] = "4K"
-        elif is_sf(self.group[index]):
-            self.group[index]["type"] = "SF"
-        elif is_fh(self.group[index]):
-            self.group[index]["type"] = "FH"
-        elif is_f(self.group[index]):
-            self.group[index]["type"] = "F"
-        elif is_s(self.group[index]):
-            self.group[index]["type"] = "S"
-        elif is_3k(self.group[index]):
-            self.group[index]["type"] = "3K"
-        elif is_2p(self.group[index]):
-            self.group[index]["type"] = "2P"
-        elif is_job(self.group[index]):
-            self.group[index]["type"] = "JoB"
-
-        if self.group[index]["type"] in RETURNS_KEYS3:
-            self.group[index]["ret"] = (
-                self.group[index]["multi"]
-                * RETURNS_DBJoB[self.group[index]["type"]]
-                * self.bet_denom
-            )
-            self.hist[self.group[index]["type"]] += 1
-
-    def evaluate_tdb(self, index):
-
-        self.group[index]["type"] = None
-        self.group[index]["ret"] = 0
-
-        if is_rf(self.group[index]):
-            self.group[index]["type"] = "RF"
-        elif is_4ka_2_4(self.group[index]):
-            self.group[index]["type"] = "4KA_2_4"
-        elif is_4k2_4_a_4(self.group[index]):
-            self.group[index]["type"] = "4K2_4_A_4"
-        elif is_4ka(self.group[index]):
-            self.group[index]["type"] = "4KA"
-        elif is_4k2_4(self.group[index]):
-            self.group[index]["type"] = "4K2_4"
-        elif is_4k(self.group[index]):
-            self.group[index]["type"] = "4K"
-        elif is_sf(self.group[index]):
-            self.group[index]["type"] = "SF"
-        elif is_fh(self.group[index]):
-            self.group[index]["type"] = "FH"
-        elif is_f(self.group[index]):
-            self.group[index]["type"] = "F"
-        elif is_s(self.group[index]):
-            self.group[index]["type"] = "S"
-        elif is_3k(self.group[index]):
-            self.group[index]["type"] = "3K"
-        elif is_2p(self.group[index]):
-            self.group[index]["type"] = "2P"
-        elif is_job(self.group[index]):
-            self.group[index]["type"] = "JoB"
-
-        if self.group[index]["type"] in RETURNS_KEYS3:
-            self.group[index]["ret"] = (
-                self.group[index]["multi"]
-                * RETURNS_TDBJoB[self.group[index]["type"]]
-                * self.bet_denom
-            )
-            self.hist[self.group[index]["type"]] += 1
+            self.group[0].update()
+            print("Updated Group:", " ".join(card_names(self.group[0].cards)))
+            print("Values", self.group[0].vals)
+            print("Values Diffs", self.group[0].d_vals)
+            print("Categories", self.group[0].cats)
+            print("Categories Diffs", self.group[0].d_cats)
+
+    def evaluate(self, index):
+        hand = self.group[index]
+        cards = hand.cards
+        ranks, flushes = self.type_tables
+        primes = self.card_primes
+        suit_bits = self.card_suit_bits
+        key = primes[cards[0]] * primes[cards[1]] * primes[cards[2]] * primes[cards[3]] * primes[cards[4]]
+        if suit_bits[cards[0]] & suit_bits[cards[1]] & suit_bits[cards[2]] & suit_bits[cards[3]] & suit_bits[cards[4]]:
+            type_index = flushes[key]
+        else:
+            type_index = ranks[key]
+
+        hand.type = self.type_names[type_index]
+        hand.ret = hand.multi * self.pays[type_index] * self.bet_denom
+        self.type_counts[type_index] += 1
+        if self.multipliers is not None:
+            self.multipliers[index] = self.ultimate_x[type_index]
 
     def analyze(self, index):
 
         # Update Balance
         
-        self.balance += self.group[index]["ret"]
+        self.balance += self.group[index].ret
         if self.balance > self.max_balance:
             self.max_balance = self.balance
 
-        if self.group[index]["ret"] > self.max_ret:
-            self.max_group = copy.deepcopy(self.group[index])
+        if self.group[index].ret > self.max_ret:
+            # Snapshot only the new best hand; records are reused next round
+            self.group[index].update()
+            self.max_group = self.group[index].snapshot()
             self.max_group["balance"] = self.balance
             self.max_group["profit"] = self.balance - self.init_balance
             self.max_group["num_steps"] = self.num_steps
-            self.max_ret = copy.deepcopy(self.group[index]["ret"])
+            self.max_ret = self.group[index].ret
 
         if self.debug or self.alg == "i":
             print(
                 "Hand",
-                self.group[index]["cards"],
+                card_names(self.group[index].cards, short=False),
                 "Type",
-                self.group[index]["type"],
+                self.group[index].type,
                 "Ret",
-                self.group[index]["ret"],
+                self.group[index].ret,
                 "Multi",
-                self.group[index]["multi"],
+                self.group[index].multi,
             )
 
     def bet(self):
-        self.balance_list[self.num_steps] = self.balance
+        start_balance = self.balance
         self.num_steps += 1
 
         if self.multi in MULTIPLER_OPTIONS:
@@ -903,20 +1756,25 @@ class VideoPokerSimulation(object):
         if self.balance <= 0:
             return
 
-        self.draw()
-        if self.keep in QUIT:
-            return
+        if self.sample_rounds:
+            self.sample_round()
+            if self.keep in QUIT:
+                return
+        else:
+            dealt = self.group[0].cards[:] if self.events is not None else None
+            self.draw()
+            if self.keep in QUIT:
+                return
 
-        for index in range(self.hands):
-            if self.game == "tdb":
-                self.evaluate_db(index)
-            elif self.game == "db":
-                self.evaluate_db(index)
-            elif self.game == "job":
-                self.evaluate_job(index)
-            self.analyze(index)
+            for index in range(self.hands):
+                self.evaluate(index)
+                self.analyze(index)
 
-        self.delta_balance_list[self.num_steps] = self.balance - self.prev_balance
+            if self.events is not None:
+                self.log_round(dealt)
+
+        if self.history is not None:
+            self.history.record(self.num_steps, start_balance, self.balance - self.prev_balance)
 
         if self.debug or self.alg == "i":
             print(
@@ -933,9 +1791,25 @@ class VideoPokerSimulation(object):
                 self.bet_denom = round(self.bet_denom - 0.05,2)
                 print("New Bet Denom:", self.bet_denom)
 
-        self.prev_group = copy.deepcopy(self.group)
+
+    def log_round(self, dealt):
+        # One event record per hand; the balance is the one after the round
+        pack = EVENT_STRUCT.pack
+        step = self.num_steps
+        balance = self.balance
+        type_ids = self.type_ids
+        hold = sum(1 << i for i, held in enumerate(self.keep_mask(self.keep)) if held)
+        self.events.record(
+            b"".join(
+                [
+                    pack(step, index, *dealt, hold, *hand.cards, type_ids[hand.type], hand.multi, hand.ret, balance)
+                    for index, hand in enumerate(self.group)
+                ]
+            )
+        )
 
     def gen_plot(self):
+        import matplotlib.pyplot as plt
 
         plt.style.use("dark_background")
 
@@ -944,8 +1818,8 @@ class VideoPokerSimulation(object):
 
         # fig, ax = plt.subplots()
 
-        x = list(range(0, self.num_steps))
-        y = self.balance_list[0 : self.num_steps]
+        x = self.history.steps
+        y = self.history.balances
 
         axs[0].plot(x, y)
         axs[0].set_title("Balance vs Num Steps")
@@ -955,16 +1829,131 @@ class VideoPokerSimulation(object):
         #axs[1].bar(types, frequency, color="maroon", width=0.4)
         #axs[1].set_title("Counts vs Hand Type")
 
-        y2 = self.delta_balance_list[0 : self.num_steps]
+        y2 = self.history.deltas
 
         axs[1].plot(x, y2)
         axs[1].set_title("Delta Balance vs Num Steps")
 
         plt.show()
 
+    def play_batch(self):
+        # Session built from array passes of BATCH_ROUNDS rounds; the exit
+        # conditions are applied to the resulting balance trajectory.
+        hand_types, pays = GAME_TYPES[self.game]
+        names = self.type_names
+        cost = self.round_cost()
+        ultimate_x = None
+        if self.multi == "ultx":
+            ultimate_x = np.array(self.ultimate_x, dtype=np.int8)
+        elif self.multi == "supt":
+            values, probs = self.super_times
+            multiplier_cdf = np.cumsum(probs)
+        rng = self.rng.generator
+        rounds = 64
+
+        while self.balance >= cost:
+            # Start small so short sessions do not deal a full batch
+            rounds = min(2 * rounds, BATCH_ROUNDS)
+            payouts, counts, best_pays, best_types, *detail = simulate_batch(
+                rounds,
+                self.hands,
+                hand_types,
+                pays,
+                self.hold_masks,
+                rng,
+                self.multipliers,
+                self.events is not None or self.decks is not None,
+                ultimate_x,
+            )
+            round_multipliers = None
+            if self.multi == "supt":
+                # One multiplier per round, drawn independently of the cards
+                round_multipliers = values[
+                    np.searchsorted(multiplier_cdf, rng.random(rounds) * multiplier_cdf[-1], side="right")
+                ]
+                payouts = payouts * round_multipliers
+                best_pays = best_pays * round_multipliers
+            balances = self.balance + np.cumsum(payouts * self.bet_denom - cost)
+            max_rets = best_pays * self.bet_denom
+
+            stop = balances < cost
+            if self.exit == "t":
+                stop |= self.num_steps + np.arange(1, rounds + 1) >= 720
+            elif self.exit == "r":
+                stop |= np.maximum.accumulate(max_rets) >= BIG_PAY * self.bet_denom
+            elif self.exit == "b":
+                stop |= (balances >= 1.2 * self.init_balance) | (
+                    balances <= 0.8 * self.init_balance
+                )
+            num = int(stop.argmax()) + 1 if stop.any() else rounds
+
+            steps = self.num_steps
+            if self.history is not None:
+                self.history.record_many(
+                    np.arange(steps + 1, steps + num + 1),
+                    np.concatenate(([self.balance], balances[: num - 1])),
+                    np.diff(balances[:num], prepend=self.balance),
+                )
+            for type_index, count in enumerate(counts[:num].sum(axis=0).tolist()):
+                self.type_counts[type_index] += count
+            if self.events is not None:
+                self.log_batch(steps, num, detail[0], round_multipliers, balances)
+            if self.decks is not None:
+                records = np.empty(num, dtype=event_dtype(deck_fields(self.hands)))
+                records["dealt"] = detail[0]["dealt"][:num]
+                records["draws"] = detail[0]["draws"][:num]
+                self.decks.record_many(records)
+
+            best = int(max_rets[:num].argmax())
+            if max_rets[best] > self.max_ret:
+                self.max_ret = float(max_rets[best])
+                self.max_group = {
+                    "type": names[int(best_types[best])],
+                    "ret": self.max_ret,
+                    "balance": float(balances[best]),
+                    "profit": float(balances[best]) - self.init_balance,
+                    "num_steps": steps + best + 1,
+                }
+            self.max_balance = max(self.max_balance, float(balances[:num].max()))
+            self.balance = float(balances[num - 1])
+            self.num_steps += num
+            if stop.any():
+                break
+
+    def log_batch(self, steps, num, arrays, round_multipliers, balances):
+        # Event records of the first num rounds of a simulate_batch() pass
+        multipliers = arrays["hand_multipliers"][:num].astype(np.uint16)
+        hand_pays = arrays["hand_pays"][:num]
+        if round_multipliers is not None:
+            multipliers = multipliers * round_multipliers[:num, None]
+            hand_pays = hand_pays * round_multipliers[:num, None]
+        records = np.empty((num, self.hands), dtype=event_dtype())
+        records["step"] = np.arange(steps + 1, steps + num + 1)[:, None]
+        records["hand"] = np.arange(self.hands)
+        records["dealt"] = arrays["dealt"][:num, None]
+        records["hold"] = (arrays["held"][:num] << np.arange(5)).sum(axis=1)[:, None]
+        records["final"] = arrays["final"][:num]
+        records["type"] = arrays["types"][:num]
+        records["multiplier"] = multipliers
+        records["payout"] = hand_pays * self.bet_denom
+        records["balance"] = balances[:num, None]
+        self.events.record_many(records)
+
+    def round_cost(self):
+        # Wager of one round: Ultimate X doubles the bet and Super Times Pay
+        # adds SUPER_T_COST per hand
+        cost = self.hands * self.bet_denom
+        if self.multi == "ultx":
+            return 2 * cost
+        if self.multi == "supt":
+            return (1 + SUPER_T_COST) * cost
+        return cost
+
     def play(self):
-        random.seed()
-        while (self.keep not in QUIT) and (self.balance >= self.hands * self.bet_denom):
+        if self.batch:
+            self.play_batch()
+
+        while (not self.batch) and (self.keep not in QUIT) and (self.balance >= self.round_cost()):
 
             self.bet()
 
@@ -973,42 +1962,841 @@ class VideoPokerSimulation(object):
                 if self.num_steps >= 720:
                     break
             elif self.exit == "r":
-                if self.max_ret >= 25 * self.bet_denom:
+                if self.max_ret >= BIG_PAY * self.bet_denom:
                     break
             elif self.exit == "b":
                 if (self.balance >= 1.2 * self.init_balance) or (self.balance <= 0.8 * self.init_balance):
                     break
 
+        self.hist = dict(zip(self.type_names[1:], self.type_counts[1:]))
+
+        if self.history is not None:
+            self.history.close()
+        if self.events is not None:
+            self.events.close()
+        if self.decks is not None:
+            self.decks.close()
+
         if self.plot == True:
             self.gen_plot()
 
         
 
         
-# MAIN FUNCTION
-def main(args):
+# EXACT ANALYSIS
+def hold_distribution(p4, cards, counts):
+    """(mask, probability) pairs of the holds p4.alg makes on a sorted hand.
+
+    counts are the hold_counts() of cards, reused by "ev" to avoid solving
+    the hand twice; "r" is the exact mixture algorith_random draws from.
+    """
+    if p4.alg == "r":
+        return [
+            (mask, 1 / 5 / math.comb(5, HOLD_SIZES[mask]))
+            for mask in HOLD_MASKS
+            if HOLD_SIZES[mask]
+        ]
+    if p4.alg == "ev":
+        pays = np.array(GAME_TYPES[p4.game][1])
+        draws = np.array([math.comb(len(p4.deck) - 5, 5 - size) for size in HOLD_SIZES])
+        return [(int((counts @ pays / draws).argmax()), 1.0)]
+    p4.group[0].cards[:] = cards
+    p4.group[0].update()
+    held = p4.keep_mask(p4.algorithm())
+    return [(sum(1 << i for i in range(5) if held[i]), 1.0)]
+
+
+def exact_chunk(args, start, stop):
+    """Weights of the distinct per-hand draw outcomes over canonical classes
+    [start, stop), keyed by (number of draws, type counts...).
+
+    Strategies outside SUIT_SYMMETRIC_ALGORITHMS cover dealt hands
+    [start, stop) of all_hands() instead, each with weight 1.
+    """
     p4 = VideoPokerSimulation(args)
+    hand_types = GAME_TYPES[args.game][0]
+    draws = [math.comb(deck_size(hand_types) - 5, 5 - size) for size in HOLD_SIZES]
+    outcomes = {}
+    if args.alg not in SUIT_SYMMETRIC_ALGORITHMS:
+        hands = all_hands(deck_size(hand_types))
+        draws = np.array(draws)
+        for batch_start in range(start, stop, EXACT_BATCH_HANDS):
+            dealt = hands[batch_start : min(batch_start + EXACT_BATCH_HANDS, stop)]
+            held = p4.hold_masks(dealt, None)
+            masks = (held.astype(np.int64) << np.arange(5)).sum(axis=1)
+            counts = hold_count_batch(dealt, held, hand_types)
+            rows, weights = np.unique(np.column_stack((draws[masks], counts)), axis=0, return_counts=True)
+            for key, weight in zip(map(tuple, rows.tolist()), weights.tolist()):
+                outcomes[key] = outcomes.get(key, 0.0) + weight
+        return outcomes
+    _, canon_hands, weights = canonical_classes(deck_size(hand_types))
+    for cards, weight in zip(canon_hands[start:stop], weights[start:stop].tolist()):
+        counts = hold_counts(cards, hand_types)
+        for mask, prob in hold_distribution(p4, cards, counts):
+            key = (draws[mask],) + tuple(counts[mask].tolist())
+            outcomes[key] = outcomes.get(key, 0.0) + weight * prob
+    return outcomes
+
+
+def exact_outcomes(args):
+    """Every dealt hand's draw outcome under -a for -g, merged by outcome.
+
+    Every dealt hand is covered, through its canonical class and weight for
+    SUIT_SYMMETRIC_ALGORITHMS and one by one otherwise, and each hold's draw
+    outcomes are counted exactly, so nothing is sampled.
+    Returns {(number of draws, type counts...): number of dealt hands}.
+    """
+    size = deck_size(GAME_TYPES[args.game][0])
+    if args.alg in SUIT_SYMMETRIC_ALGORITHMS:
+        num_items = len(canonical_classes(size)[1])
+    else:
+        num_items = math.comb(size, 5)
+    num_chunks = max(1, 4 * args.workers)
+    bounds = [num_items * i // num_chunks for i in range(num_chunks + 1)]
+    chunks = [(args, bounds[i], bounds[i + 1]) for i in range(num_chunks)]
+    if args.workers > 1:
+        with multiprocessing.Pool(args.workers, register_paytables, (args.paytables,)) as pool:
+            results = pool.starmap(exact_chunk, chunks)
+    else:
+        results = itertools.starmap(exact_chunk, chunks)
+    outcomes = {}
+    for result in results:
+        for key, weight in result.items():
+            outcomes[key] = outcomes.get(key, 0.0) + weight
+    return outcomes
+
+
+def exact_type_probs(args):
+    """Exact probability of each final hand type per hand for -a and -g.
+
+    Returns (names, probs) indexed like hand_table_arrays().
+    """
+    names = hand_table_arrays(GAME_TYPES[args.game][0])[0]
+    probs = np.zeros(len(names))
+    for (draws, *counts), weight in exact_outcomes(args).items():
+        probs += np.array(counts) * (weight / draws)
+    return names, probs / math.comb(deck_size(GAME_TYPES[args.game][0]), 5)
+
+
+def round_payout_distributions(args, big_pays=()):
+    """Exact distribution of a round's total payout in bets for -n hands.
+
+    All hands share the dealt hand's hold and draw independently, so each
+    distinct per-hand outcome is convolved -n times and mixed by weight.
+    Also returns, for each of big_pays, the part of it where no hand pays
+    that much or more (the -e r stop), as a dict.
+    """
+    pays = np.array(GAME_TYPES[args.game][1])
+    size = pays.max() * args.hands + 1
+    total = np.zeros(size)
+    smalls = {big_pay: np.zeros(size) for big_pay in big_pays}
+    for (draws, *counts), weight in exact_outcomes(args).items():
+        per_hand = hand_payout_distribution(counts, draws, pays)
+        total += weight * convolve_power(per_hand, args.hands)
+        for big_pay, small in smalls.items():
+            small += weight * convolve_power(np.where(np.arange(len(per_hand)) < big_pay, per_hand, 0), args.hands)
+    hands = math.comb(deck_size(GAME_TYPES[args.game][0]), 5)
+    total /= hands
+    for small in smalls.values():
+        small /= hands
+    return total, smalls
+
+
+def ruin_solver(dist, start, cost, lower=None, upper=None, max_rounds=None, dist_small=None, tol=1e-12):
+    """Session outcome of a bankroll walk by DP over integer balances.
+
+    Each round costs cost units and pays x units with probability dist[x];
+    play needs balance >= cost and stops at balance <= lower or >= upper,
+    after max_rounds rounds, or when a round falls outside dist_small (a
+    hit). Without an upper stop, balances past a grid cap are reported as
+    "grid_cap". Returns (outcome probabilities, expected rounds, ending
+    balance distribution indexed by balance).
+    """
+    lo = cost if lower is None else max(cost, lower + 1)
+    hi = upper - 1 if upper is not None else max(2 * start, start + len(dist))
+    width = hi - lo + 1
+    dist_keep = dist_small if dist_small is not None else dist
+
+    # Only the transient window [lo, hi] is iterated. A move b -> b - cost + x
+    # stays in it only for x < width + cost, so the kernel is truncated there.
+    kernel = dist_keep[: width + cost]
+    n = 1 << (width + len(kernel) - 2).bit_length()
+    kernel_fft = np.fft.rfft(kernel, n)
+
+    alive = np.zeros(width)
+    if lo <= start <= hi:
+        alive[start - lo] = 1.0
+    visits = np.zeros(width)
+    rounds = 0
+    while alive.sum() > tol and (max_rounds is None or rounds < max_rounds):
+        visits += alive
+        rounds += 1
+        moved = np.fft.irfft(np.fft.rfft(alive, n) * kernel_fft, n)
+        alive = np.clip(moved[cost : cost + width], 0, None)
+
+    # Mass leaving the window is linear in the visits, so it is recovered in
+    # one full convolution; index j of it is balance lo - cost + j.
+    left = np.convolve(visits, dist_keep)
+    left[cost : cost + width] = 0
+    ending = np.zeros(lo - cost + len(left))
+    ending[lo - cost :] += left
+    outcome = {"target": 0.0, "stop_loss": 0.0, "ruin": 0.0, "time": 0.0, "grid_cap": 0.0}
+    if dist_small is not None:
+        hit = np.convolve(visits, dist - dist_small)
+        outcome["target"] += hit.sum()
+        ending[lo - cost :] += hit
+        ending_left = ending - np.pad(hit, (lo - cost, 0))
+    else:
+        ending_left = ending.copy()
+    if start < lo or start > hi:
+        ending_left[start] += 1.0
+        ending[start] += 1.0
+
+    below = ending_left[:lo].copy()
+    if lower is not None:
+        outcome["stop_loss"] += below[: lower + 1].sum()
+        below[: lower + 1] = 0
+    outcome["ruin"] += below.sum()
+    if upper is not None:
+        outcome["target"] += ending_left[upper:].sum()
+    else:
+        outcome["grid_cap"] += ending_left[hi + 1 :].sum()
+
+    outcome["time"] = alive.sum()
+    ending[lo : hi + 1] += alive
+    outcome = {key: float(value) for key, value in outcome.items()}
+    return outcome, float(visits.sum()), ending
+
+
+def ruin_analysis(args):
+    # Balances are in units of one bet; every paytable pays whole bets. The
+    # Super Times Pay surcharge needs a grid of 1 / SUPER_T_COST units per bet
+    if args.multi == "supt":
+        scale = int(round(1 / SUPER_T_COST))
+        values, probs = super_times_distribution(args.supt_prob, args.supt_multipliers)
+        cost = int(round(args.hands * (1 + SUPER_T_COST) * scale))
+    else:
+        scale = 1
+        values, probs = np.array([1]), np.array([1.0])
+        cost = args.hands
+    start = int(round(args.stack / args.bet_denom * scale))
+    lower = upper = max_rounds = None
+    big_pays = []
+    if args.exit == "b":
+        lower = int(math.floor(0.8 * start + 1e-9))
+        upper = int(math.ceil(1.2 * start - 1e-9))
+    elif args.exit == "t":
+        max_rounds = 720
+    elif args.exit == "r":
+        # A hand stops play once its multiplied pay reaches BIG_PAY
+        big_pays = [-(-BIG_PAY // value) for value in values.tolist()]
+    dist, smalls = round_payout_distributions(args, big_pays)
+    dist = scale_mixture(dist, values, probs, scale)
+    dist_small = None
+    if big_pays:
+        dist_small = np.zeros(len(dist))
+        for k, big_pay in enumerate(big_pays):
+            part = scale_mixture(smalls[big_pay], values[k : k + 1], probs[k : k + 1], scale)
+            dist_small[: len(part)] += part
+    outcome, expected_rounds, ending = ruin_solver(
+        dist, start, cost, lower, upper, max_rounds, dist_small
+    )
+    balances = np.arange(len(ending)) * args.bet_denom / scale
+    cdf = np.cumsum(ending) / ending.sum()
+    quantiles = {q: float(balances[np.searchsorted(cdf, q)]) for q in (0.05, 0.25, 0.5, 0.75, 0.95)}
+    print(
+        "p_target", outcome["target"],
+        "\np_stop_loss", outcome["stop_loss"],
+        "\np_ruin", outcome["ruin"],
+        "\np_time_limit", outcome["time"],
+        "\np_grid_cap", outcome["grid_cap"],
+        "\nexpected_rounds", expected_rounds,
+        "\nexpected_time_min", expected_rounds / 12.0,
+        "\nexpected_end_balance", float(ending @ balances),
+        "\nend_balance_quantiles", quantiles,
+    )
+
+
+def exact_analysis(args):
+    names, probs = exact_type_probs(args)
+    pays = np.array(GAME_TYPES[args.game][1])
+    exact_return = float(probs @ pays)
+    variance = float(probs @ pays ** 2) - exact_return ** 2
+    if args.multi == "supt":
+        # The round multiplier is independent of the cards; per bet wagered,
+        # including the surcharge, a hand returns m * x / (1 + SUPER_T_COST)
+        values, mult_probs = super_times_distribution(args.supt_prob, args.supt_multipliers)
+        mean = float(mult_probs @ values)
+        second = float(mult_probs @ values ** 2)
+        wager = 1 + SUPER_T_COST
+        variance = (second * (variance + exact_return ** 2) - (mean * exact_return) ** 2) / wager ** 2
+        exact_return = mean * exact_return / wager
+        print("super_times_mean_multiplier", mean)
+    print(
+        "exact_return",
+        exact_return,
+        "\nvariance",
+        variance,
+        "\nhit_frequency",
+        {name: float(prob) for name, prob in zip(names[1:], probs[1:])},
+    )
+
+
+def replay_returns(args, decks):
+    """Per-round return per bet wagered of -a/-g/-m on recorded decks.
+
+    The rounds are played in order through resolve_batch(), so Ultimate X
+    multipliers carry over as in a session. Random choices (-a r and the
+    Super Times Pay multiplier) come from the --seed generator, so two
+    replays with the same seed share them as well as the cards.
+    """
+    p4 = VideoPokerSimulation(args, args.seed)
+    hand_types, pays = GAME_TYPES[args.game]
+    rng = p4.rng.generator
+    cost = args.hands
+    if args.multi == "ultx":
+        cost *= 2
+    elif args.multi == "supt":
+        cost *= 1 + SUPER_T_COST
+        values, probs = p4.super_times
+        multiplier_cdf = np.cumsum(probs)
+    returns = np.empty(len(decks))
+    for start in range(0, len(decks), BATCH_ROUNDS):
+        chunk = decks[start : start + BATCH_ROUNDS]
+        dealt = chunk["dealt"].astype(np.int8)
+        draws = chunk["draws"][:, : args.hands].astype(np.int8)
+        payouts = resolve_batch(
+            dealt, draws, hand_types, pays, p4.hold_masks, rng, p4.multipliers, ultimate_x=ultimate_x_table(args.game)
+        )[0]
+        if args.multi == "supt":
+            payouts = payouts * values[
+                np.searchsorted(multiplier_cdf, rng.random(len(chunk)) * multiplier_cdf[-1], side="right")
+            ]
+        returns[start : start + len(chunk)] = payouts / cost
+    return returns
+
+
+def replay_analysis(args):
+    # Common random numbers: every replay of the file sees the same cards,
+    # so the paired difference to a baseline cancels most card variance
+    header, decks = read_event_log(args.replay)
+    if "draws" not in decks.dtype.names:
+        raise ValueError("%s is an event log, not a --record_decks file" % args.replay)
+    for flag, game in (("-g", args.game), ("--baseline_game", args.baseline_game)):
+        if game and header["deck_size"] != deck_size(GAME_TYPES[game][0]):
+            raise ValueError("%s was dealt from a %d-card deck; %s %s uses %d cards" % (
+                args.replay, header["deck_size"], flag, game, deck_size(GAME_TYPES[game][0])))
+    if args.hands > header["hands"]:
+        raise ValueError("%s recorded %d hands per round; -n is %d" % (args.replay, header["hands"], args.hands))
+    returns = replay_returns(args, decks)
+    rounds = len(returns)
+    stderr = float(returns.std() / math.sqrt(rounds))
+    print(
+        "replay_rounds", rounds,
+        "\nreplay_return", float(returns.mean()),
+        "\nreplay_return_stderr", stderr,
+    )
+    if args.baseline_alg or args.baseline_game:
+        baseline_args = argparse.Namespace(**vars(args))
+        baseline_args.alg = args.baseline_alg or args.alg
+        baseline_args.game = args.baseline_game or args.game
+        baseline = replay_returns(baseline_args, decks)
+        baseline_stderr = float(baseline.std() / math.sqrt(rounds))
+        difference = returns - baseline
+        paired_stderr = float(difference.std() / math.sqrt(rounds))
+        independent_stderr = math.hypot(stderr, baseline_stderr)
+        print(
+            "baseline_return", float(baseline.mean()),
+            "\nbaseline_return_stderr", baseline_stderr,
+            "\nreturn_difference", float(difference.mean()),
+            "\nreturn_difference_stderr", paired_stderr,
+            "\nindependent_difference_stderr", independent_stderr,
+            "\ncrn_variance_ratio", independent_stderr ** 2 / paired_stderr ** 2 if paired_stderr else math.inf,
+        )
+
+
+# MONTE CARLO ESTIMATORS
+# Dealt hands are stratified by the most cards to a royal flush they hold in
+# one suit (0-5): the few hands near a royal carry most of the variance.
+ROYAL_STRATA = 6
+ESTIMATE_PILOT = 200
+CI_Z = 1.959963984540054
+# Adaptive -z runs (--ci_target/--time_budget) check the CI after at least
+# ADAPTIVE_MIN_SESSIONS and report progress about every PROGRESS_SECONDS
+ADAPTIVE_MIN_SESSIONS = 30
+PROGRESS_SECONDS = 2.0
+
+
+def royal_strata(hands):
+    """Most cards of one suit ranked ten or better in each hand of an int array."""
+    hands = np.asarray(hands, dtype=np.int64)
+    royal = (hands // 4 >= 8) & (hands < JOKER)
+    return np.stack([(royal & (hands % 4 == suit)).sum(axis=-1) for suit in range(4)], axis=-1).max(axis=-1)
+
+
+@functools.lru_cache(maxsize=None)
+def stratum_moments(hand_types, pays):
+    """Exact stratum probabilities and mean dealt-hand pay over every deal.
+
+    The dealt hand's own pay and the stratum indicators are the control
+    variates of the "cv" estimator; these are their known means.
+    """
+    hands = all_hands(deck_size(hand_types))
+    probs = np.bincount(royal_strata(hands), minlength=ROYAL_STRATA) / len(hands)
+    dealt_pay = float(np.array(pays)[classify_batch(hands, hand_types)].mean())
+    return probs, dealt_pay
+
+
+def draw_orders(dealt, size, rng):
+    """A random order of 5 replacement cards from the rest of each deck."""
+    keys = rng.random((len(dealt), size))
+    np.put_along_axis(keys, dealt.astype(np.int64), 2.0, axis=1)
+    return keys.argsort(axis=1)[:, :5].astype(np.int8)
+
+
+def sample_stratum(stratum, num, size, rng):
+    """num uniform sorted dealt hands from one royal stratum.
+
+    Candidates take stratum royal cards of a random suit and fill the rest
+    from the deck. A hand with stratum royal cards in k suits can be built
+    k ways, so it is kept with probability 1 / k; hands that reach more
+    royal cards are rejected.
+    """
+    hands = []
+    found = 0
+    while found < num:
+        rows = 2 * (num - found) + 16
+        suits = rng.integers(4, size=rows)
+        ranks = rng.random((rows, 5)).argsort(axis=1)[:, :stratum] + 8
+        royal = ranks * 4 + suits[:, None]
+        keys = rng.random((rows, size))
+        np.put_along_axis(keys, royal, 2.0, axis=1)
+        candidates = np.concatenate((royal, keys.argsort(axis=1)[:, : 5 - stratum]), axis=1)
+        royal_cards = (candidates // 4 >= 8) & (candidates < JOKER)
+        counts = np.stack([(royal_cards & (candidates % 4 == suit)).sum(axis=1) for suit in range(4)], axis=1)
+        ways = (counts == stratum).sum(axis=1)
+        keep = (counts.max(axis=1) == stratum) & (rng.random(rows) * ways < 1)
+        hands.append(candidates[keep])
+        found += int(keep.sum())
+    return np.sort(np.concatenate(hands)[:num], axis=1).astype(np.int8)
+
+
+def hand_returns(p4, dealt, rng, exact_draws=False):
+    """Single-hand payouts in bets of p4's strategy on dealt hands.
+
+    With exact_draws, each payout is replaced by its exact expectation over
+    every draw to the hold (conditional Monte Carlo), leaving only the
+    variance of the dealt hands.
+    """
+    hand_types, pays = GAME_TYPES[p4.game]
+    if exact_draws:
+        held = p4.hold_masks(dealt, rng)
+        unseen = deck_size(hand_types) - 5
+        draws = np.array([math.comb(unseen, 5 - size) for size in range(6)])[held.sum(axis=1)]
+        return hold_count_batch(dealt, held, hand_types) @ np.array(pays) / draws
+    draws = draw_orders(dealt, deck_size(hand_types), rng)[:, None, :]
+    return resolve_batch(dealt, draws, hand_types, pays, p4.hold_masks, rng)[0].astype(np.float64)
+
+
+def estimate_exact_draws(args):
+    """Whether --estimate averages the draws exactly.
+
+    The strata and controls only see the dealt hand, while most of the
+    variance is in the draw, so stratified, is and cv average it exactly
+    unless --no-exact_draws is given; plain samples it unless asked.
+    """
+    if args.exact_draws is None:
+        return args.estimate != "plain"
+    return args.exact_draws
+
+
+def estimate_return(args):
+    """Per-hand return of -a on -g from --samples dealt hands.
+
+    "plain" averages uniform deals. "stratified" samples every royal
+    stratum in proportion to its probability (at least two hands each) and
+    weights the stratum means. "is" draws strata from a defensive Neyman
+    proposal fitted on an ESTIMATE_PILOT-hand pilot per stratum and
+    reweights each hand by p / q. "cv" regresses uniform-deal payouts on
+    the dealt hand's pay and the stratum indicators, whose exact means are
+    known. Draws are averaged exactly (see hand_returns()) as chosen by
+    estimate_exact_draws(). Returns (estimate, standard error, hands
+    simulated).
+    """
+    exact_draws = estimate_exact_draws(args)
+    p4 = VideoPokerSimulation(args, args.seed)
+    rng = p4.rng.generator
+    hand_types, pays = GAME_TYPES[args.game]
+    size = deck_size(hand_types)
+    samples = args.samples
+
+    if args.estimate in ("plain", "cv"):
+        dealt, _ = deal_batch(samples, 1, size, rng)
+        returns = hand_returns(p4, dealt, rng, exact_draws)
+        if args.estimate == "plain":
+            return float(returns.mean()), float(returns.std(ddof=1) / math.sqrt(samples)), samples
+        probs, dealt_pay = stratum_moments(hand_types, pays)
+        strata = royal_strata(dealt)
+        controls = np.column_stack(
+            [np.array(pays)[classify_batch(dealt, hand_types)] - dealt_pay]
+            + [(strata == stratum) - probs[stratum] for stratum in range(1, ROYAL_STRATA)]
+        )
+        beta = np.linalg.lstsq(controls - controls.mean(axis=0), returns - returns.mean(), rcond=None)[0]
+        adjusted = returns - controls @ beta
+        return float(adjusted.mean()), float(adjusted.std(ddof=1 + len(beta)) / math.sqrt(samples)), samples
+
+    probs, _ = stratum_moments(hand_types, pays)
+    if args.estimate == "stratified":
+        counts = np.maximum(2, np.round(samples * probs)).astype(int)
+        estimate = variance = 0.0
+        for stratum, (prob, count) in enumerate(zip(probs, counts)):
+            returns = hand_returns(p4, sample_stratum(stratum, count, size, rng), rng, exact_draws)
+            estimate += prob * returns.mean()
+            variance += prob ** 2 * returns.var(ddof=1) / count
+        return float(estimate), math.sqrt(variance), int(counts.sum())
+
+    # Importance sampling over strata
+    deviations = np.array([
+        hand_returns(p4, sample_stratum(stratum, ESTIMATE_PILOT, size, rng), rng, exact_draws).std(ddof=1)
+        for stratum in range(ROYAL_STRATA)
+    ])
+    neyman = probs * deviations / (probs * deviations).sum()
+    proposal = 0.5 * neyman + 0.5 * probs
+    counts = rng.multinomial(samples, proposal)
+    weighted = np.concatenate([
+        probs[stratum] / proposal[stratum]
+        * hand_returns(p4, sample_stratum(stratum, count, size, rng), rng, exact_draws)
+        for stratum, count in enumerate(counts.tolist())
+        if count
+    ])
+    pilot = ROYAL_STRATA * ESTIMATE_PILOT
+    return float(weighted.mean()), float(weighted.std(ddof=1) / math.sqrt(samples)), samples + pilot
+
+
+def estimate_analysis(args):
+    estimate, stderr, hands = estimate_return(args)
+    print(
+        "estimate_method", args.estimate,
+        "\nestimate_exact_draws", estimate_exact_draws(args),
+        "\nestimate_hands", hands,
+        "\nestimate_return", estimate,
+        "\nestimate_stderr", stderr,
+        "\nestimate_ci95", (estimate - CI_Z * stderr, estimate + CI_Z * stderr),
+    )
+
+
+# MAIN FUNCTION
+def spawn_seeds(sequence, num_sessions):
+    """The next num_sessions integer seeds of a SeedSequence.
+
+    Successive calls continue the same stream, so an adaptive run's first n
+    sessions are those of -z n with the same --seed.
+    """
+    children = sequence.spawn(num_sessions)
+    return [int.from_bytes(child.generate_state(4).tobytes(), "little") for child in children]
+
+
+class RunningStats(object):
+    """Welford running mean and variance of a stream of values."""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def push(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    @property
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else math.inf
+
+    def half_width(self):
+        """Half-width of the 95% CI on the mean."""
+        return CI_Z * math.sqrt(self.variance / self.count) if self.count else math.inf
+
+    def ci95(self):
+        return (self.mean - self.half_width(), self.mean + self.half_width())
+
+
+def adaptive_stop(args, balance, num_steps, elapsed):
+    """Why an adaptive -z run should stop now, or None to keep dispatching."""
+    if args.ci_target and balance.count >= ADAPTIVE_MIN_SESSIONS and all(
+        stats.half_width() <= args.ci_target * abs(stats.mean) for stats in (balance, num_steps)
+    ):
+        return "ci_target"
+    if args.time_budget and elapsed >= args.time_budget:
+        return "time_budget"
+    if args.mcruns > 1 and balance.count >= args.mcruns:
+        return "mcruns"
+    return None
+
+
+def sessions_needed(stats, ci_target):
+    """Sessions at which the CI half-width of stats reaches ci_target of its mean."""
+    if not stats.half_width():
+        return 0
+    if not stats.mean:
+        return math.inf
+    # The half-width shrinks as 1/sqrt(sessions)
+    return stats.count * (stats.half_width() / (ci_target * abs(stats.mean))) ** 2
+
+
+def next_batch_size(args, balance, num_steps, rate, elapsed):
+    """Sessions for the next adaptive batch: about PROGRESS_SECONDS of work,
+    cut to what the time budget, CI target and -z cap still need."""
+    size = rate * PROGRESS_SECONDS
+    if args.time_budget:
+        size = min(size, rate * (args.time_budget - elapsed))
+    if args.ci_target:
+        # Both CIs must be met; near the target the projection is noisy, so
+        # batches stay at least ADAPTIVE_MIN_SESSIONS
+        needed = max(sessions_needed(balance, args.ci_target), sessions_needed(num_steps, args.ci_target))
+        size = min(size, max(needed - balance.count, ADAPTIVE_MIN_SESSIONS))
+    size = max(args.workers, int(size))
     if args.mcruns > 1:
-        balance = 0.0
-        num_steps = 0.0
+        size = min(size, args.mcruns - balance.count)
+    return size
+
+
+def run_session(args, seed):
+    """Play one Monte Carlo session and return (balance, num_steps)."""
+    p4 = VideoPokerSimulation(args, seed)
+    p4.play()
+    return p4.balance, p4.num_steps
+
+
+def profile_startup(args, parsed_time):
+    """Time one session from interpreter start and report heavy imports.
+
+    Import covers the module body from its first line, parse the registry
+    and argument parsing, setup the simulation tables and session the play
+    loop of the session.
+    """
+    setup_start = time.perf_counter()
+    p4 = VideoPokerSimulation(args, args.seed)
+    session_start = time.perf_counter()
+    p4.play()
+    end = time.perf_counter()
+    print(
+        "import_seconds",
+        IMPORT_TIME - START_TIME,
+        "\nparse_seconds",
+        parsed_time - IMPORT_TIME,
+        "\nsetup_seconds",
+        session_start - setup_start,
+        "\nsession_seconds",
+        end - session_start,
+        "\ntotal_seconds",
+        end - START_TIME,
+        "\nloaded_modules",
+        {name: is_loaded(name) for name in ("numpy", "matplotlib")},
+    )
+
+
+class PhaseProfiler(object):
+    """Per-phase timing of one simulation's play().
+
+    Wraps the PROFILE_PHASES methods on the instance itself, so simulations
+    that are not profiled run the plain methods with no added cost. Time in
+    a phase called from another (the strategy inside draw()) counts only
+    toward the inner phase; play() keeps the loop and bookkeeping time.
+    dump_path, if given, gets cProfile stats (.pstats/.prof) or folded phase
+    stacks for flamegraph tools (any other extension). Allocations are left
+    to profile_allocations(), so tracemalloc does not slow the timed run.
+    """
+
+    def __init__(self, p4, dump_path=None):
+        self.p4 = p4
+        self.dump_path = dump_path
+        # Self time and calls by phase stack, e.g. ("play", "draw", "algorithm")
+        self.folded = {}
+        self.calls = {}
+        self.stack = ["play"]
+        self.child_times = [0.0]
+        for phase in PROFILE_PHASES:
+            setattr(p4, phase, self.wrap(phase, getattr(p4, phase)))
+        setattr(p4, "play", self.profile_play(p4.play))
+
+    def wrap(self, phase, method):
+        clock = time.perf_counter
+        stack = self.stack
+        child_times = self.child_times
+        folded = self.folded
+        calls = self.calls
+
+        def timed(*args):
+            stack.append(phase)
+            child_times.append(0.0)
+            start = clock()
+            try:
+                return method(*args)
+            finally:
+                elapsed = clock() - start
+                path = tuple(stack)
+                folded[path] = folded.get(path, 0.0) + elapsed - child_times.pop()
+                calls[path] = calls.get(path, 0) + 1
+                stack.pop()
+                child_times[-1] += elapsed
+
+        return timed
+
+    def profile_play(self, play):
+        def profiled():
+            profile = None
+            if self.dump_path and os.path.splitext(self.dump_path)[1] in (".pstats", ".prof"):
+                import cProfile
+
+                profile = cProfile.Profile()
+            start = time.perf_counter()
+            if profile is not None:
+                profile.enable()
+            play()
+            if profile is not None:
+                profile.disable()
+            self.total_time = time.perf_counter() - start
+            phase_time = sum(self.folded.values())
+            self.folded[("play",)] = self.total_time - phase_time
+            self.calls[("play",)] = 1
+            if profile is not None:
+                profile.dump_stats(self.dump_path)
+            elif self.dump_path:
+                with open(self.dump_path, "w") as file:
+                    for path, seconds in self.folded.items():
+                        file.write("%s %d\n" % (";".join(path), round(seconds * 1e6)))
+
+        return profiled
+
+    def report(self):
+        times = {}
+        calls = {}
+        for path, seconds in self.folded.items():
+            times[path[-1]] = times.get(path[-1], 0.0) + seconds
+            calls[path[-1]] = calls.get(path[-1], 0) + self.calls.get(path, 0)
+        hands = self.p4.num_steps * self.p4.hands
+        print(
+            "profile_seconds",
+            self.total_time,
+            "\nprofile_hands_per_sec",
+            hands / self.total_time if self.total_time else 0.0,
+            "\nprofile_phases",
+            {
+                phase: {"calls": calls[phase], "seconds": seconds, "share": seconds / self.total_time}
+                for phase, seconds in sorted(times.items(), key=lambda item: -item[1])
+            },
+        )
+        if self.dump_path:
+            print("Profile written to", self.dump_path)
+
+
+def profile_allocations(args):
+    """Play the session again under tracemalloc and report its allocations.
+
+    This pass runs without the phase timers and after the timed one, so
+    neither skews the other. It reports the peak and the blocks this module
+    still holds when play() returns. File outputs and plots stay with the
+    timed run.
+    """
+    args = argparse.Namespace(
+        **dict(vars(args), plot=False, history_file=None, event_log=None, record_decks=None)
+    )
+    p4 = VideoPokerSimulation(args, args.seed)
+    tracemalloc.start()
+    p4.play()
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    statistics = tracemalloc.take_snapshot().filter_traces(
+        (tracemalloc.Filter(True, os.path.abspath(__file__)),)
+    ).statistics("lineno")
+    tracemalloc.stop()
+    print(
+        "profile_peak_traced_bytes",
+        peak_memory,
+        "\nprofile_live_blocks",
+        sum(stat.count for stat in statistics),
+        "\nprofile_top_live_allocations",
+        {
+            "line %d" % stat.traceback[0].lineno: {"blocks": stat.count, "bytes": stat.size}
+            for stat in sorted(statistics, key=lambda stat: -stat.count)[:PROFILE_TOP_ALLOCATIONS]
+        },
+    )
+
+
+def main(args):
+    adaptive = args.ci_target or args.time_budget
+    if args.mcruns > 1 or adaptive:
+        balance = RunningStats()
+        num_steps = RunningStats()
         max_balance = 0
         max_balance_num_steps = 0
-        for i in range(int(args.mcruns)):
-            p4.play()
-            balance   += p4.balance
-            num_steps += p4.num_steps
-            if p4.balance > max_balance:
-                max_balance = p4.balance
-                max_balance_num_steps = p4.num_steps
-            p4.__init__(args)
+        sequence = np.random.SeedSequence(args.seed)
+        batch_size = args.mcruns
+        if adaptive:
+            batch_size = max(args.workers, ADAPTIVE_MIN_SESSIONS)
+            if args.mcruns > 1:
+                batch_size = min(batch_size, args.mcruns)
+        stop_reason = None
+        pool = None
+        if args.workers > 1:
+            pool = multiprocessing.Pool(args.workers, register_paytables, (args.paytables,))
+        start = time.perf_counter()
+        try:
+            while stop_reason is None:
+                seeds = spawn_seeds(sequence, batch_size)
+                batch_start = time.perf_counter()
+                if pool:
+                    chunksize = max(1, len(seeds) // (4 * args.workers))
+                    results = pool.starmap(run_session, [(args, seed) for seed in seeds], chunksize)
+                else:
+                    results = map(run_session, itertools.repeat(args), seeds)
+                for session_balance, session_num_steps in results:
+                    balance.push(session_balance)
+                    num_steps.push(session_num_steps)
+                    if session_balance > max_balance:
+                        max_balance = session_balance
+                        max_balance_num_steps = session_num_steps
+                if not adaptive:
+                    break
+                now = time.perf_counter()
+                stop_reason = adaptive_stop(args, balance, num_steps, now - start)
+                print(
+                    "sessions %d  ave_balance %.4f +/- %.4f (%.2f%%)  ave_time_min %.2f +/- %.2f  elapsed %.1fs"
+                    % (
+                        balance.count,
+                        balance.mean,
+                        balance.half_width(),
+                        100 * balance.half_width() / abs(balance.mean) if balance.mean else math.inf,
+                        num_steps.mean / 12.0,
+                        num_steps.half_width() / 12.0,
+                        now - start,
+                    ),
+                    flush=True,
+                )
+                batch_size = next_batch_size(args, balance, num_steps, len(seeds) / (now - batch_start), now - start)
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+        ave_time_min = num_steps.ci95()
         print(
-            "\nave_balance", balance/args.mcruns, 
-            "\nave_time_min", num_steps/args.mcruns/12.0, 
+            "\nave_balance", balance.mean, 
+            "\nave_balance_ci95", balance.ci95(),
+            "\nave_time_min", num_steps.mean/12.0, 
+            "\nave_time_min_ci95", (ave_time_min[0]/12.0, ave_time_min[1]/12.0),
             "\nmax_balance", max_balance, 
             "\nmax_balance_time_min", max_balance_num_steps/12.0
             )
+        if adaptive:
+            print("sessions", balance.count, "\nstop_reason", stop_reason)
     else:
+        p4 = VideoPokerSimulation(args, args.seed)
+        if args.profile:
+            profiler = PhaseProfiler(p4, args.profile_dump)
         p4.play()
+        if "cards" in p4.max_group:
+            p4.max_group["cards"] = card_names(p4.max_group["cards"], short=False)
         print(
             "max_group",
             p4.max_group,
@@ -1021,9 +2809,14 @@ def main(args):
             "\ntime_spent",
             p4.num_steps / 12,
         )
-
-# COMMAND-LINE EXECUTION
-if __name__ == "__main__":
+        if args.profile:
+            profiler.report()
+        if args.profile_memory:
+            profile_allocations(args)
+
+# ARGUMENT PARSER
+def build_parser():
+    """Command-line parser; -g choices come from the paytable registry."""
     parser = argparse.ArgumentParser(
         prog="Video Poker Simulation",
         description="Simulation, Analyze, and Play Video Poker.",
@@ -1032,19 +2825,164 @@ if __name__ == "__main__":
     parser.add_argument("-r", "--reduce_bet", action="store_true", help="Reduce Bet based on Balance")
     parser.add_argument("-p", "--plot", action="store_true", help="Create Anaylsis Plots")
     parser.add_argument("-z", "--mcruns", default=1, help="Run Z Monte Carlo Sims", type=int)
-    parser.add_argument("-a", "--alg", default="s1", choices=["s1","r","d","k","i"], 
-        help="Algorithm choice. r=random, k=hold all, d = discard all, i = user input, s1 = optimizate")
-    parser.add_argument("-g", "--game", default="job", choices=["job","db","tdb"],
-        help="Game. job: Jacks or Better, db: Double Bonus, tdb: Tripler Double Bonus")
+    parser.add_argument("--ci_target", default=None, type=float,
+        help="Run -z sessions in batches until the 95%% CIs of ave_balance and ave_time_min are within this "
+        "fraction of their means; -z, if given, caps the sessions")
+    parser.add_argument("--time_budget", default=None, type=float,
+        help="Run -z sessions in batches until this many seconds have passed (or --ci_target is met)")
+    parser.add_argument("-w", "--workers", default=1, type=int, help="Worker processes for -z Monte Carlo sessions")
+    parser.add_argument("-a", "--alg", default="s1", choices=["s1","ev","st","r","d","k","i"], 
+        help="Algorithm choice. r=random, k=hold all, d = discard all, i = user input, s1 = optimizate, ev = exact expected value, st = strategy table")
+    parser.add_argument("-g", "--game", default="job" if "job" in GAME_TYPES else next(iter(GAME_TYPES)), choices=list(GAME_TYPES),
+        help="Game. " + ", ".join("%s: %s" % item for item in GAME_NAMES.items()))
+    parser.add_argument("--paytables", default=PAYTABLES_PATH,
+        help="Paytable config (JSON, TOML or YAML) defining the -g games")
     parser.add_argument("-m", "--multi", default=None, choices=[None, "ultx","supt"],
         help="Multiplier Type. ultx: Ultimate X, supt: Super Times Pay")
+    parser.add_argument("--supt_prob", default=SUPER_T_PROB, type=float,
+        help="Super Times Pay chance that a round draws a multiplier")
+    parser.add_argument("--supt_multipliers", default=SUPER_T_MULTIPLER, type=int, nargs="+",
+        help="Super Times Pay multipliers, equally likely once a round triggers")
     parser.add_argument("-s", "--stack", default=100, type=float, help="Enter balance in $")
     parser.add_argument("-b", "--bet_denom", default=0.05, type=float, help="Enter bet amount in $")
     parser.add_argument("-n", "--hands", default=10, type=int, help="Enter number of hands")
+    parser.add_argument("--batch", action="store_true",
+        help="Simulate rounds with the NumPy batch engine (no -a i or -r, and no -a ev with -m ultx)")
+    parser.add_argument("--build_strategy", action="store_true",
+        help="Build the -a st strategy table for -g in --strategy_dir and exit")
+    parser.add_argument("--strategy_dir", default=".", help="Directory of strategy_<game>.npy tables")
+    parser.add_argument("--seed", default=None, type=int, help="Seed for reproducible runs")
+    parser.add_argument("--rng", default="random", choices=RNG_BACKENDS,
+        help="Random backend. random: Mersenne Twister, pcg64/philox: buffered NumPy generators")
+    parser.add_argument("--history_stride", default=1, type=int, help="Record every Nth round of the balance history")
+    parser.add_argument("--history_file", default=None,
+        help="Stream (step, balance, delta) float64 rows of the balance history to this file")
+    parser.add_argument("--record_decks", default=None,
+        help="With --batch, record each round's dealt cards and draw orders to this file for --replay")
+    parser.add_argument("--replay", default=None,
+        help="Replay a --record_decks file with -a/-g/-m/-n and report the return (no new deals)")
+    parser.add_argument("--baseline_alg", default=None, choices=["s1","ev","st","r","d","k"],
+        help="With --replay, also replay this algorithm on the same decks and report the paired difference")
+    parser.add_argument("--baseline_game", default=None, choices=list(GAME_TYPES),
+        help="With --replay, also replay this game on the same decks and report the paired difference")
+    parser.add_argument("--estimate", default=None, choices=["plain", "stratified", "is", "cv"],
+        help="Estimate the per-hand return of -a for -g with a 95%% CI from --samples hands. plain: uniform deals, "
+        "stratified: royal-card strata, is: importance-sampled strata, cv: control variates. Most of the variance "
+        "reduction comes from --exact_draws, the default for all but plain")
+    parser.add_argument("--samples", default=100000, type=int, help="Dealt hands for --estimate")
+    parser.add_argument("--exact_draws", default=None, action=argparse.BooleanOptionalAction,
+        help="With --estimate, replace each simulated draw by its exact expectation given the hold "
+        "(default: on for stratified, is and cv, off for plain)")
+    parser.add_argument("--event_log", default=None,
+        help="Stream a binary per-hand record (dealt, hold, final cards, type, multiplier, payout, balance) to this file")
+    parser.add_argument("-x", "--exact", action="store_true",
+        help="Compute the exact return, variance and hit frequencies of -a for -g (no simulation)")
+    parser.add_argument("--ruin", action="store_true",
+        help="Solve session outcome odds, length and ending balance for -s/-b/-n/-e exactly (no simulation)")
+    parser.add_argument("--sample_rounds", action="store_true",
+        help="Sample each round's total payout from its exact distribution (no per-hand draws or histogram)")
     parser.add_argument("-e","--exit",default=None, choices=["t","r","b"],
         help="Exit Condition. t: num-bets = 720, r:return >= 25*bet-amount, b: 0.8*stack < balance < 1.8*stack")
+    parser.add_argument("--profile_startup", "--profile-startup", action="store_true",
+        help="Play one session and print import, setup and session times and the heavy modules loaded")
+    parser.add_argument("--profile", action="store_true",
+        help="Report hands/sec and per-phase time shares at the end of play()")
+    parser.add_argument("--profile_memory", action="store_true",
+        help="With --profile, play the session again under tracemalloc and report its peak and live allocations")
+    parser.add_argument("--profile_dump", default=None,
+        help="With --profile, write cProfile stats (.pstats/.prof) or folded flamegraph stacks (other names) here")
 
+    return parser
+
+
+IMPORT_TIME = time.perf_counter()
+
+# COMMAND-LINE EXECUTION
+if __name__ == "__main__":
+    # The paytable registry sets the -g choices, so it is read first
+    paytables_parser = argparse.ArgumentParser(add_help=False)
+    paytables_parser.add_argument("--paytables", default=PAYTABLES_PATH)
+    paytables = paytables_parser.parse_known_args()[0].paytables
+    if paytables != PAYTABLES_PATH:
+        GAME_TYPES.clear()
+        GAME_NAMES.clear()
+        GAME_ULTIMATE_X.clear()
+        register_paytables(paytables)
+
+    parser = build_parser()
     args = parser.parse_args()
+    parsed_time = time.perf_counter()
+    if args.batch and (args.alg == "i" or args.reduce_bet):
+        parser.error("--batch does not support -a i or -r")
+    if args.batch and args.multi == "ultx" and args.alg == "ev":
+        # Batch holds are chosen before the carried multipliers are known
+        parser.error("--batch with -m ultx does not support -a ev")
+    if args.sample_rounds and (args.batch or args.alg == "i" or args.multi == "ultx"):
+        parser.error("--sample_rounds does not support --batch, -a i or -m ultx")
+    if (args.exact or args.ruin or args.replay or args.estimate) and (
+        args.history_file or args.event_log or args.record_decks
+    ):
+        # The analyses build simulations per chunk, which would truncate the outputs
+        parser.error("--exact, --ruin, --replay and --estimate do not play a session; "
+            "drop --history_file, --event_log and --record_decks")
+    if args.history_stride < 1:
+        parser.error("--history_stride must be at least 1")
+    if args.history_file and args.mcruns > 1:
+        parser.error("--history_file records a single run; drop -z")
+    if args.event_log and (args.mcruns > 1 or args.sample_rounds):
+        parser.error("--event_log records the hands of a single run; drop -z and --sample_rounds")
+    if args.record_decks and (not args.batch or args.mcruns > 1):
+        parser.error("--record_decks records the decks of a single --batch run")
+    if args.replay and (args.alg == "i" or args.reduce_bet or (args.multi == "ultx" and "ev" in (args.alg, args.baseline_alg))):
+        # Replays are played by the batch engine
+        parser.error("--replay does not support -a i, -r or -m ultx with -a ev")
+    if (args.baseline_alg or args.baseline_game) and not args.replay:
+        parser.error("--baseline_alg and --baseline_game need --replay")
+    if args.estimate and (args.alg == "i" or args.multi is not None):
+        # The estimators sample single hands of the base game
+        parser.error("--estimate does not support -a i or -m")
+    if args.profile and args.mcruns > 1:
+        parser.error("--profile reports a single run; drop -z")
+    if (args.ci_target or args.time_budget) and (
+        args.alg == "i" or args.history_file or args.event_log or args.record_decks or args.profile
+    ):
+        parser.error("--ci_target and --time_budget do not support -a i, --history_file, --event_log, "
+            "--record_decks or --profile")
+    if (args.ci_target is not None and args.ci_target <= 0) or (args.time_budget is not None and args.time_budget <= 0):
+        parser.error("--ci_target and --time_budget must be positive")
+    if (args.profile_dump or args.profile_memory) and not args.profile:
+        parser.error("--profile_dump and --profile_memory need --profile")
+    if args.profile_memory and args.alg == "i":
+        parser.error("--profile_memory replays the session, which -a i does not support")
+    if (args.workers > 1 or args.exact or args.ruin) and args.alg == "i":
+        parser.error("--workers, --exact and --ruin do not support -a i")
+    if args.ruin and (args.multi == "ultx" or args.reduce_bet):
+        parser.error("--ruin does not support -m ultx or -r")
+    if args.exact and args.multi == "ultx":
+        # Ultimate X multipliers carry between rounds, so one hold's return is not the game's
+        parser.error("--exact does not support -m ultx")
+    if not 0 <= args.supt_prob <= 1 or min(args.supt_multipliers) < 1:
+        parser.error("--supt_prob must be in [0, 1] and --supt_multipliers at least 1")
     if args.debug == True:
         os.system("cls")
+    if args.build_strategy:
+        path = strategy_table_path(args.strategy_dir, args.game)
+        np.save(path, build_strategy_table(*GAME_TYPES[args.game]))
+        print("Strategy table written to", path)
+        sys.exit()
+    if args.exact:
+        exact_analysis(args)
+        sys.exit()
+    if args.ruin:
+        ruin_analysis(args)
+        sys.exit()
+    if args.replay:
+        replay_analysis(args)
+        sys.exit()
+    if args.estimate:
+        estimate_analysis(args)
+        sys.exit()
+    if args.profile_startup:
+        profile_startup(args, parsed_time)
+        sys.exit()
     main(args)